@@ -14,9 +14,14 @@ import threading
 import time
 import requests
 from datetime import datetime
-from shopify_client import ShopifyClient
+from shopify_client import ShopifyClient, catalog_product
+from catalog_store import CatalogStore, catalog_scope
+from post_history import get_post_history
+from shared_cache import get_shared_cache
+from http_cache import shared_http_cache
+from shopify_retry import ShopifyError, retry_stats
 from social_clients import FacebookClient, InstagramClient, ThreadsClient
-from smart_selector import SmartSelector, is_adult_product, TARGET_COLLECTION_ID
+from smart_selector import SmartSelector, is_adult_product, invalidate_candidate_pools, TARGET_COLLECTION_ID
 from config import Config
 from image_utils import create_story_image_url
 from content_generator import build_post_content, get_today_post_type
@@ -415,13 +420,40 @@ def get_config():
     return Config()
 
 
+# 本機商品快照（每個 worker process 共用一個連線）
+_catalog_store = None
+_CATALOG_LOCK = threading.Lock()
+
+
+def get_catalog_store(config):
+    global _catalog_store
+    with _CATALOG_LOCK:
+        if _catalog_store is None:
+            _catalog_store = CatalogStore(config.CATALOG_DB_PATH)
+        return _catalog_store
+
+
 def get_shopify_client(config):
     return ShopifyClient(
         store_url=config.SHOPIFY_STORE_URL,
-        access_token=config.SHOPIFY_ACCESS_TOKEN
+        access_token=config.SHOPIFY_ACCESS_TOKEN,
+        catalog=get_catalog_store(config)
     )
 
 
+def get_stats_cache(config):
+    """後台統計的共用快取（所有 worker 同時最多一個在重新計算）"""
+    def load():
+        return SmartSelector(get_shopify_client(config), config).get_stats()
+    return get_shared_cache(config.STATS_CACHE_PATH, load, config.STATS_CACHE_TTL)
+
+
+def invalidate_catalog_caches(product_id=None):
+    """商品或發文記錄有變動：候選池與後台統計都標記為過期"""
+    invalidate_candidate_pools(product_id)
+    get_stats_cache(get_config()).invalidate()
+
+
 def post_to_platforms(content, platforms, config):
     """發布到各平台（貼文 + 限動）"""
     results = {}
@@ -522,13 +554,20 @@ def handle_new_product_async(product):
     config = get_config()
     shopify = get_shopify_client(config)
 
-    products_in_collection = shopify.get_products_by_collection_id(TARGET_COLLECTION_ID, limit=250)
-    ids_in_collection = {p['id'] for p in products_in_collection}
-
-    if product_id not in ids_in_collection:
+    # 只查這一個商品，不抓整個系列
+    try:
+        in_collection = shopify.is_product_in_collection(product_id, TARGET_COLLECTION_ID)
+    except ShopifyError as e:
+        print(f"[Webhook] ❌ 無法確認商品是否在目標系列，跳過：{title}（{e}）")
+        return
+    if not in_collection:
         print(f"[Webhook] ⏭️  商品不在目標系列（ID: {TARGET_COLLECTION_ID}），跳過：{title}")
         return
 
+    # Webhook 內容就是完整商品資料，直接加進本機快照
+    shopify.catalog.upsert_products([catalog_product(product)], catalog_scope(TARGET_COLLECTION_ID))
+    invalidate_catalog_caches()
+
     if is_adult_product(product):
         print(f"[Webhook] 🔞 成人商品，跳過：{title}")
         return
@@ -543,12 +582,77 @@ def handle_new_product_async(product):
     results = post_to_platforms(content, platforms, config)
 
     append_log(title, results, post_type='product')
+    if any(r.get('success') for r in results.values()):
+        get_post_history(config.POST_HISTORY_DB_PATH).record_post(product_id, 'fashion', results)
 
     for platform, result in results.items():
         status = "✅" if result.get('success') else "❌"
         print(f"[Webhook] {status} {platform}：{result.get('post_id') or result.get('error')}")
 
 
+# 商品被修改後，等幾秒再重新確認系列成員資格（等 smart collection 規則套用完）
+SCOPE_REFRESH_DELAY = 5
+
+
+class ScopeRefreshQueue:
+    """
+    待確認系列成員資格的商品（同一個商品只排一次，單一背景 thread 依序處理）
+    大量匯入時同一個商品的多次 Webhook 只會確認一次
+    """
+
+    def __init__(self, delay=SCOPE_REFRESH_DELAY):
+        self.delay = delay
+        self._pending = {}  # product_id -> 可以開始確認的時間（time.monotonic()）
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def schedule(self, product_id):
+        """排入確認（已在排隊中就不重複排）"""
+        product_id = int(product_id)
+        with self._cond:
+            if product_id in self._pending:
+                return False
+            self._pending[product_id] = time.monotonic() + self.delay
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._cond.notify()
+            return True
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _next_due(self):
+        """等到有商品可以確認，回傳它的 ID"""
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                product_id, due = min(self._pending.items(), key=lambda item: item[1])
+                wait = due - time.monotonic()
+                if wait <= 0:
+                    # 確認開始前移出，確認期間再收到的 Webhook 會重新排入
+                    del self._pending[product_id]
+                    return product_id
+                self._cond.wait(wait)
+
+    def _run(self):
+        while True:
+            product_id = self._next_due()
+            try:
+                shopify = get_shopify_client(get_config())
+                scopes = shopify.refresh_product_scopes(product_id)
+                invalidate_catalog_caches()
+                print(f"[Webhook] 🔄 商品 {product_id} 目前在：{', '.join(scopes) or '（沒有已同步的系列）'}")
+            except Exception as e:
+                print(f"[Webhook] ⚠️  商品 {product_id} 系列成員資格確認失敗: {e}")
+
+
+scope_refresh_queue = ScopeRefreshQueue()
+
+
 # ============================================
 # 路由
 # ============================================
@@ -606,6 +710,84 @@ def webhook_product_created():
     return jsonify({'success': True, 'message': '已收到，背景處理中'}), 200
 
 
+# ============================================
+# 🔄 商品快照 Webhook 端點
+# products/update、products/delete、collections/create|update|delete
+# 直接更新本機快照，選品和統計讀到的資料只會落後幾秒
+# ============================================
+def read_webhook_payload():
+    """驗證簽名並取出 JSON，失敗時回傳 (None, 錯誤回應)"""
+    if not verify_shopify_webhook(request):
+        print("[Webhook] ❌ 簽名驗證失敗，拒絕請求")
+        return None, (jsonify({'error': 'Invalid signature'}), 401)
+
+    payload = request.get_json(silent=True)
+    if not payload or not payload.get('id'):
+        return None, (jsonify({'error': 'No data'}), 400)
+    return payload, None
+
+
+@app.route('/webhook/product-updated', methods=['POST'])
+def webhook_product_updated():
+    product, error = read_webhook_payload()
+    if error:
+        return error
+
+    shopify = get_shopify_client(get_config())
+    # 要在寫入快照前比較：smart collection 規則用到的欄位（含款式價格、庫存）沒變就不必重新確認系列
+    scopes_may_change = shopify.membership_fields_changed(product)
+    written = shopify.apply_product_update(product)
+    if written:
+        invalidate_catalog_caches(product['id'])
+    print(f"[Webhook] 🔄 商品更新：{product.get('title', 'Unknown')} (ID: {product['id']})"
+          f"{'' if written else '（比快照舊，略過）'}")
+
+    # 比快照舊的 payload 不必確認（較新的那次更新已經排過）
+    if written and scopes_may_change:
+        scope_refresh_queue.schedule(product['id'])
+
+    return jsonify({'success': True}), 200
+
+
+@app.route('/webhook/product-deleted', methods=['POST'])
+def webhook_product_deleted():
+    payload, error = read_webhook_payload()
+    if error:
+        return error
+
+    shopify = get_shopify_client(get_config())
+    shopify.apply_product_delete(payload['id'])
+    invalidate_catalog_caches(payload['id'])
+    print(f"[Webhook] 🗑️  商品已刪除 (ID: {payload['id']})")
+    return jsonify({'success': True}), 200
+
+
+@app.route('/webhook/collection-updated', methods=['POST'])
+def webhook_collection_updated():
+    collection, error = read_webhook_payload()
+    if error:
+        return error
+
+    shopify = get_shopify_client(get_config())
+    shopify.apply_collection_update(collection)
+    invalidate_catalog_caches()
+    print(f"[Webhook] 🔄 系列更新：{collection.get('title', 'Unknown')} (ID: {collection['id']})")
+    return jsonify({'success': True}), 200
+
+
+@app.route('/webhook/collection-deleted', methods=['POST'])
+def webhook_collection_deleted():
+    payload, error = read_webhook_payload()
+    if error:
+        return error
+
+    shopify = get_shopify_client(get_config())
+    shopify.apply_collection_delete(payload['id'])
+    invalidate_catalog_caches()
+    print(f"[Webhook] 🗑️  系列已刪除 (ID: {payload['id']})")
+    return jsonify({'success': True}), 200
+
+
 # ============================================
 # 內部 API（需登入）
 # ============================================
@@ -639,27 +821,41 @@ def api_post():
         post_type = post_type_param
     print(f"[api_post] 貼文類型：{post_type}")
 
+    # ?fresh=true：不用快取的 AI 文案，重新產生
+    bypass_cache = request.args.get('fresh', 'false').lower() == 'true'
+
     posted = []
-    for i in range(count):
-        product, cat = selector.get_next_product('fashion')
-        if not product:
-            break
-        content = build_post_content(product, config, post_type=post_type)
+    error = None
+    try:
+        picks = selector.get_next_products(count, 'fashion')
+    except ShopifyError as e:
+        picks = []
+        error = f'Shopify API 錯誤: {e}'
+
+    for product, cat in picks:
+        content = build_post_content(product, config, post_type=post_type, bypass_cache=bypass_cache)
         results = post_to_platforms(content, platforms, config)
         append_log(product.get('title', ''), results, post_type=post_type)
+        if any(r.get('success') for r in results.values()):
+            selector.mark_as_posted(product, cat, results)
+            get_stats_cache(config).invalidate()
         posted.append({
             'title': product.get('title'),
             'post_type': post_type,
             'platforms': results
         })
 
-    return jsonify({
+    response = {
         'success': len(posted) > 0,
         'count': len(posted),
         'post_type': post_type,
         'posts': posted,
         'timestamp': datetime.now().isoformat()
-    })
+    }
+    if error:
+        response['error'] = error
+        return jsonify(response), 502
+    return jsonify(response)
 
 
 @app.route('/api/get-secret-url')
@@ -672,6 +868,13 @@ def api_get_secret_url():
 
     return jsonify({
         'webhook_url': f"{base_url}/webhook/product-created",
+        'catalog_webhook_urls': {
+            'products/update': f"{base_url}/webhook/product-updated",
+            'products/delete': f"{base_url}/webhook/product-deleted",
+            'collections/create': f"{base_url}/webhook/collection-updated",
+            'collections/update': f"{base_url}/webhook/collection-updated",
+            'collections/delete': f"{base_url}/webhook/collection-deleted",
+        },
         'manual_url': f"{base_url}/post/smart?secret={api_secret}"
     })
 
@@ -682,13 +885,23 @@ def api_stats():
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
 
     config = get_config()
-    shopify = get_shopify_client(config)
-    selector = SmartSelector(shopify, config)
-    stats = selector.get_stats()
+    stats_cache = get_stats_cache(config)
+    try:
+        # 有快取就直接回傳（過期時在背景更新），只有第一次需要等 Shopify
+        stats = stats_cache.get()
+    except ShopifyError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Shopify API 錯誤: {e}',
+            'shopify_requests': retry_stats.snapshot(),
+        }), 502
 
     return jsonify({
         'success': True,
         'stats': stats,
+        'stats_cache': stats_cache.status(),
+        'http_cache': shared_http_cache.stats(),
+        'shopify_requests': retry_stats.snapshot(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -730,13 +943,19 @@ def post_smart():
         config = get_config()
         shopify = get_shopify_client(config)
         selector = SmartSelector(shopify, config)
-        for i in range(count):
-            product, cat = selector.get_next_product('fashion')
-            if not product:
-                break
+        try:
+            picks = selector.get_next_products(count, 'fashion')
+        except ShopifyError as e:
+            print(f"[post_smart] ❌ 無法取得商品：{e}")
+            return
+
+        for product, cat in picks:
             content = build_post_content(product, config, post_type=post_type)
             results = post_to_platforms(content, platforms, config)
             append_log(product.get('title', ''), results, post_type=post_type)
+            if any(r.get('success') for r in results.values()):
+                selector.mark_as_posted(product, cat, results)
+                get_stats_cache(config).invalidate()
             for platform, result in results.items():
                 status = "✅" if result.get('success') else "❌"
                 print(f"[post_smart] {status} {platform}")
@@ -0,0 +1,330 @@
+"""
+非同步 Shopify API 客戶端（asyncio + httpx）
+方法與 ShopifyClient 相同，一個 event loop 就能同時跑多個目錄查詢、
+多個 webhook 的系列檢查，不需要每個請求開一個 thread
+
+使用方式：
+    async with AsyncShopifyClient(store_url, token) as client:
+        products, collections = await asyncio.gather(
+            client.get_products_by_collection_id(449326186730),
+            client.get_collections(),
+        )
+"""
+
+import asyncio
+
+import httpx
+
+import shopify_graphql as gql
+from shopify_client import (
+    TAG_QUERY_CHUNK_SIZE, PRODUCT_IDS_CHUNK_SIZE,
+    order_by_ids, product_fields_params, plan_tag_mutations, collect_tag_results,
+    report_tag_results, plan_prefix_removal, graphql_error, graphql_throttle_wait,
+)
+from shopify_rate_limit import get_bucket, parse_retry_after
+from shopify_retry import (
+    ShopifyError, ShopifyConnectionError, ShopifyNotFoundError, ShopifyThrottledError,
+    ShopifyTimeoutError, DEFAULT_RETRY_POLICY, error_for_status, raise_for_status, retry_stats,
+)
+
+# 同時開啟的連線數上限（實際送出速度仍由共用的 leaky bucket 控制）
+DEFAULT_MAX_CONNECTIONS = 10
+
+
+class AsyncShopifyClient:
+    """非同步 Shopify API 客戶端"""
+
+    def __init__(self, store_url, access_token=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 retry_policy=DEFAULT_RETRY_POLICY):
+        """
+        初始化客戶端
+
+        Args:
+            store_url: 商店網址
+            access_token: Shopify Admin API access token
+            max_connections: 連線池大小
+            retry_policy: 重試次數、退避時間與操作期限
+        """
+        self.store_url = store_url.rstrip('/')
+        self.access_token = access_token
+        self.retry_policy = retry_policy
+
+        headers = {}
+        if access_token:
+            headers = {
+                'X-Shopify-Access-Token': access_token,
+                'Content-Type': 'application/json',
+            }
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=30,
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    # ------------------------------------------------------------
+    # 請求
+    # ------------------------------------------------------------
+
+    async def _send(self, method, url, deadline=None, **kwargs):
+        """經過共用的呼叫額度控制發送請求，連線失敗、逾時、429、5xx 時退避重試"""
+        policy = self.retry_policy
+        if deadline is None:
+            deadline = policy.new_deadline()
+        bucket = get_bucket(self.store_url) if self.access_token else None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if bucket:
+                wait = bucket.reserve()
+                if wait > 0:
+                    retry_stats.record_wait(wait)
+                    await asyncio.sleep(wait)
+
+            retry_stats.record_request()
+            response = None
+            try:
+                response = await self.client.request(
+                    method, url, timeout=policy.timeout_for(deadline), **kwargs
+                )
+            except httpx.TimeoutException as e:
+                error = ShopifyTimeoutError(f"請求逾時: {e}")
+            except httpx.TransportError as e:
+                error = ShopifyConnectionError(f"連線失敗: {e}")
+            except httpx.HTTPError as e:
+                retry_stats.record_failure()
+                raise ShopifyError(f"API 請求失敗: {e}") from e
+            else:
+                if bucket:
+                    bucket.update(response.headers)
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                error = error_for_status(response.status_code, f"HTTP {response.status_code} ({method} {url})")
+
+            retry_after = None
+            if isinstance(error, ShopifyThrottledError):
+                retry_after = parse_retry_after(response.headers, default=None)
+            delay = policy.next_delay(error, attempt, deadline, retry_after)
+
+            if bucket and isinstance(error, ShopifyThrottledError):
+                bucket.block_for(delay)
+            else:
+                retry_stats.record_wait(delay, throttled=isinstance(error, ShopifyThrottledError))
+                await asyncio.sleep(delay)
+
+    async def _make_request(self, endpoint, params=None, deadline=None):
+        """發送 API 請求，失敗時丟出 ShopifyError"""
+        if self.access_token:
+            url = f"{self.store_url}/admin/api/2024-10/{endpoint}"
+        else:
+            url = f"{self.store_url}/{endpoint}"
+
+        response = await self._send('GET', url, deadline=deadline, params=params)
+        raise_for_status(response)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise ShopifyError(f"回應不是有效的 JSON: {e}", response.status_code) from e
+
+    async def _graphql_request(self, query, variables=None, deadline=None):
+        """發送 GraphQL Admin API 請求，回傳 data（沒有 token 時回傳 None），失敗時丟出 ShopifyError"""
+        if not self.access_token:
+            print("需要 Admin API Token 才能使用 GraphQL")
+            return None
+
+        policy = self.retry_policy
+        if deadline is None:
+            deadline = policy.new_deadline()
+        url = f"{self.store_url}/admin/api/2024-10/graphql.json"
+        payload = {'query': query, 'variables': variables or {}}
+
+        attempt = 0
+        while True:
+            attempt += 1
+            response = await self._send('POST', url, deadline=deadline, json=payload)
+            raise_for_status(response)
+            try:
+                result = response.json()
+            except ValueError as e:
+                raise ShopifyError(f"GraphQL 回應不是有效的 JSON: {e}", response.status_code) from e
+
+            error = graphql_error(result)
+            if error is None:
+                return result.get('data')
+
+            retry_after = graphql_throttle_wait(result, default=None) if error.retryable else None
+            delay = policy.next_delay(error, attempt, deadline, retry_after)
+            retry_stats.record_wait(delay)
+            await asyncio.sleep(delay)
+
+    # ------------------------------------------------------------
+    # 商品與系列
+    # ------------------------------------------------------------
+
+    async def _fetch_product_pages(self, params, limit=250):
+        """用 since_id 翻頁抓取 products.json 的所有結果"""
+        params = dict(params, limit=limit)
+        all_products = []
+        deadline = self.retry_policy.new_deadline()
+
+        while True:
+            data = await self._make_request('products.json', params, deadline)
+            if 'products' not in data:
+                raise ShopifyError("products.json 回應缺少 products")
+
+            products = data['products']
+            all_products.extend(products)
+
+            if len(products) < limit:
+                break
+
+            params['since_id'] = products[-1]['id']
+
+        return all_products
+
+    async def get_products_by_collection_id(self, collection_id, limit=250, fields='full'):
+        """用 Collection ID 抓取該系列的所有商品"""
+        if not self.access_token:
+            print("需要 Admin API Token 才能用 collection_id 查詢")
+            return []
+
+        params = dict(product_fields_params(fields), collection_id=int(collection_id))
+        return await self._fetch_product_pages(params, limit)
+
+    async def _fetch_collection_pages(self, kind, limit=250):
+        params = {'limit': limit}
+        collections = []
+        deadline = self.retry_policy.new_deadline()
+
+        while True:
+            data = await self._make_request(f'{kind}.json', params, deadline)
+            if kind not in data:
+                raise ShopifyError(f"{kind}.json 回應缺少 {kind}")
+
+            page = data[kind]
+            collections.extend(page)
+
+            if len(page) < limit:
+                return collections
+
+            params['since_id'] = page[-1]['id']
+
+    async def get_collections(self):
+        """取得所有 custom / smart collections（同時抓兩種）"""
+        if not self.access_token:
+            print("需要 Admin API Token 才能取得系列列表")
+            return []
+
+        custom, smart = await asyncio.gather(
+            self._fetch_collection_pages('custom_collections'),
+            self._fetch_collection_pages('smart_collections'),
+        )
+        return custom + smart
+
+    async def get_product_by_id(self, product_id, fields='full'):
+        """取得特定商品，找不到時回傳 None"""
+        if not self.access_token:
+            return None
+
+        try:
+            data = await self._make_request(f'products/{product_id}.json', product_fields_params(fields))
+        except ShopifyNotFoundError:
+            return None
+        if data and 'product' in data:
+            return data['product']
+        return None
+
+    async def get_products_by_ids(self, product_ids, fields='full'):
+        """一次取得多個商品（各批同時查詢），回傳 (依輸入順序的商品列表, 找不到的 ID)"""
+        ids = list(dict.fromkeys(int(pid) for pid in product_ids))
+        if not self.access_token:
+            print("需要 Admin API Token 才能用 ID 查詢商品")
+            return [], ids
+
+        chunks = [ids[i:i + PRODUCT_IDS_CHUNK_SIZE] for i in range(0, len(ids), PRODUCT_IDS_CHUNK_SIZE)]
+        pages = await asyncio.gather(*(
+            self._make_request('products.json', dict(
+                product_fields_params(fields), ids=','.join(map(str, chunk)), limit=len(chunk)
+            ))
+            for chunk in chunks
+        ))
+        return order_by_ids(ids, [p for page in pages for p in page.get('products', [])])
+
+    async def is_product_in_collection(self, product_id, collection_id):
+        """用一次 products.json?collection_id=&ids= 檢查商品是否在系列中"""
+        data = await self._make_request('products.json', {
+            'collection_id': int(collection_id),
+            'ids': int(product_id),
+            'fields': 'id',
+            'limit': 1,
+        })
+        return any(p.get('id') == int(product_id) for p in data.get('products', []))
+
+    # ------------------------------------------------------------
+    # 標籤
+    # ------------------------------------------------------------
+
+    async def get_product_tags(self, product_ids):
+        """用 GraphQL nodes(ids:) 取得多個商品目前的標籤（各批同時查詢）"""
+        ids = [int(pid) for pid in product_ids]
+        chunks = [ids[i:i + TAG_QUERY_CHUNK_SIZE] for i in range(0, len(ids), TAG_QUERY_CHUNK_SIZE)]
+        pages = await asyncio.gather(*(
+            self._graphql_request(gql.PRODUCT_TAGS_QUERY, {'ids': [gql.to_gid('Product', pid) for pid in chunk]})
+            for chunk in chunks
+        ))
+
+        tags_by_id = {}
+        for data in pages:
+            for node in (data or {}).get('nodes') or []:
+                if node and node.get('id'):
+                    tags_by_id[gql.gid_to_id(node['id'])] = node.get('tags') or []
+        return tags_by_id
+
+    async def batch_update_tags(self, operations):
+        """批次新增 / 移除標籤，回傳 {product_id: {'success', 'error'}}"""
+        results, batches = plan_tag_mutations(operations)
+
+        if not self.access_token:
+            print("需要 Admin API Token 才能修改標籤")
+            return {pid: {'success': False, 'error': '缺少 Admin API Token'} for pid in results}
+
+        responses = await asyncio.gather(*(
+            self._graphql_request(mutation, variables) for _, mutation, variables in batches
+        ), return_exceptions=True)
+        for (chunk, _, _), data in zip(batches, responses):
+            if isinstance(data, ShopifyError):
+                collect_tag_results(results, chunk, None, failure=data)
+            elif isinstance(data, BaseException):
+                raise data
+            else:
+                collect_tag_results(results, chunk, data)
+
+        report_tag_results(results)
+        return results
+
+    async def add_tag_to_product(self, product_id, new_tag):
+        """為商品新增標籤，回傳是否成功"""
+        product_id = int(product_id)
+        results = await self.batch_update_tags([{'product_id': product_id, 'add': [new_tag]}])
+        return results[product_id]['success']
+
+    async def remove_tags_with_prefix(self, product_id, prefix):
+        """移除商品中符合前綴的標籤，回傳是否成功"""
+        product_id = int(product_id)
+        try:
+            current_tags = await self.get_product_tags([product_id])
+        except ShopifyError as e:
+            print(f"取得標籤失敗: {e}")
+            return False
+        results, operations = plan_prefix_removal([product_id], current_tags, prefix)
+        results.update(await self.batch_update_tags(operations))
+        return results[product_id]['success']
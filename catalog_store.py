@@ -0,0 +1,327 @@
+"""
+本機商品目錄快照
+把 Shopify 商品存進 SQLite，選品、Webhook、統計直接讀本機資料，
+不必每次都把整個 products.json 重新翻頁抓一次
+"""
+
+import json
+import os
+from itertools import islice
+import sqlite3
+import threading
+import time
+
+# 不分系列的完整目錄使用的 scope 名稱
+ALL_PRODUCTS_SCOPE = 'all'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id          INTEGER PRIMARY KEY,
+    handle      TEXT,
+    created_at  TEXT NOT NULL DEFAULT '',
+    updated_at  TEXT,
+    data        TEXT NOT NULL
+);
+
+-- created_at 複製一份到 memberships，依系列讀最新商品時直接走索引，不必排序整個系列
+CREATE TABLE IF NOT EXISTS memberships (
+    scope       TEXT NOT NULL,
+    product_id  INTEGER NOT NULL,
+    created_at  TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (scope, product_id)
+);
+CREATE INDEX IF NOT EXISTS idx_memberships_product ON memberships (product_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    scope            TEXT PRIMARY KEY,
+    last_updated_at  TEXT,
+    synced_at        REAL,
+    full_synced_at   REAL
+);
+"""
+
+# 要在舊版資料庫補上 memberships.created_at 之後才能建立
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_memberships_newest ON memberships (scope, created_at DESC, product_id DESC);
+DROP INDEX IF EXISTS idx_products_created_at;
+"""
+
+
+def catalog_scope(collection_id=None):
+    """把 collection_id 轉成快照用的 scope 字串（None = 全部商品）"""
+    if collection_id is None:
+        return ALL_PRODUCTS_SCOPE
+    return str(int(collection_id))
+
+
+class CatalogStore:
+    """SQLite 商品快照（同一個檔案可被多個 process / thread 共用）"""
+
+    def __init__(self, db_path):
+        """
+        初始化快照
+
+        Args:
+            db_path: SQLite 檔案路徑
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            # WAL 讓 gunicorn 多個 worker 同時讀寫不互相卡住
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+            self._migrate()
+            self._conn.executescript(_INDEXES)
+            self._conn.commit()
+
+    def _migrate(self):
+        """舊版快照：補上 memberships.created_at，created_at 的 NULL 改成空字串"""
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(memberships)')}
+        if 'created_at' in columns:
+            return
+        with self._conn:
+            self._conn.execute("UPDATE products SET created_at = '' WHERE created_at IS NULL")
+            self._conn.execute("ALTER TABLE memberships ADD COLUMN created_at TEXT NOT NULL DEFAULT ''")
+            self._conn.execute(
+                'UPDATE memberships SET created_at = '
+                '(SELECT created_at FROM products WHERE products.id = memberships.product_id) '
+                'WHERE product_id IN (SELECT id FROM products)'
+            )
+
+    # ------------------------------------------------------------
+    # 寫入
+    # ------------------------------------------------------------
+
+    @staticmethod
+    def _product_row(product):
+        return (
+            int(product['id']),
+            product.get('handle'),
+            product.get('created_at') or '',
+            product.get('updated_at'),
+            json.dumps(product, ensure_ascii=False),
+        )
+
+    def upsert_products(self, products, scope=None, only_newer=False):
+        """
+        新增或更新商品
+
+        Args:
+            products: Shopify 商品列表
+            scope: 同時把商品加入這個 scope（選填）
+            only_newer: 只在 updated_at 不比快照舊時才覆蓋（Webhook 可能不照順序送達）
+
+        Returns:
+            實際寫入的商品數量
+        """
+        with self._lock, self._conn:
+            return self._upsert(products, scope, only_newer)
+
+    def _upsert(self, products, scope=None, only_newer=False):
+        """upsert_products() 的本體（呼叫端要先拿鎖、開交易）"""
+        rows = [self._product_row(p) for p in products if p.get('id')]
+        if not rows:
+            return 0
+
+        sql = (
+            'INSERT INTO products (id, handle, created_at, updated_at, data) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET handle=excluded.handle, '
+            'created_at=excluded.created_at, updated_at=excluded.updated_at, '
+            'data=excluded.data'
+        )
+        if only_newer:
+            sql += (' WHERE products.updated_at IS NULL OR excluded.updated_at IS NULL '
+                    'OR excluded.updated_at >= products.updated_at')
+
+        cur = self._conn.executemany(sql, rows)
+        written = cur.rowcount
+        ids = [(row[0],) for row in rows]
+        # created_at 幾乎不會變，沒變時只是一次索引查詢
+        self._conn.executemany(
+            'UPDATE memberships SET created_at = (SELECT created_at FROM products WHERE id = ?1) '
+            'WHERE product_id = ?1 AND created_at <> (SELECT created_at FROM products WHERE id = ?1)',
+            ids,
+        )
+        if scope is not None:
+            self._add_memberships(scope, [row[0] for row in rows])
+        return written
+
+    def _add_memberships(self, scope, product_ids):
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO memberships (scope, product_id, created_at) '
+            'SELECT ?, id, created_at FROM products WHERE id = ?',
+            [(scope, product_id) for product_id in product_ids],
+        )
+
+    def replace_scope(self, scope, products):
+        """
+        完整同步：用這批商品取代 scope 原本的成員
+
+        Args:
+            scope: scope 字串
+            products: 完整的商品列表
+        """
+        # 刪除和重新寫入在同一個交易：其他 worker 不會讀到清空的 scope
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM memberships WHERE scope = ?', (scope,))
+            return self._upsert(products, scope)
+
+    def set_product_scopes(self, product_id, add=(), remove=()):
+        """
+        調整單一商品所屬的 scope
+
+        Args:
+            product_id: 商品 ID
+            add: 要加入的 scope
+            remove: 要移出的 scope
+        """
+        product_id = int(product_id)
+        with self._lock, self._conn:
+            for scope in add:
+                self._add_memberships(scope, [product_id])
+            self._conn.executemany(
+                'DELETE FROM memberships WHERE scope = ? AND product_id = ?',
+                [(scope, product_id) for scope in remove],
+            )
+
+    def expire_scope(self, scope):
+        """讓 scope 下次讀取時重新完整同步（例如 smart collection 的規則改了）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE sync_state SET synced_at = 0, full_synced_at = 0 WHERE scope = ?', (scope,)
+            )
+
+    def drop_scope(self, scope):
+        """移除 scope 的成員與同步狀態（系列被刪除時）"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM memberships WHERE scope = ?', (scope,))
+            self._conn.execute('DELETE FROM sync_state WHERE scope = ?', (scope,))
+
+    def delete_product(self, product_id):
+        """刪除商品（連同所有 scope 的成員資格）"""
+        product_id = int(product_id)
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM memberships WHERE product_id = ?', (product_id,))
+            cur = self._conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+        return cur.rowcount > 0
+
+    def mark_synced(self, scope, last_updated_at, full=False):
+        """記錄同步時間與已同步到的 updated_at"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT full_synced_at FROM sync_state WHERE scope = ?', (scope,)
+            ).fetchone()
+            full_synced_at = now if full or not row else row['full_synced_at']
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sync_state '
+                '(scope, last_updated_at, synced_at, full_synced_at) VALUES (?, ?, ?, ?)',
+                (scope, last_updated_at, now, full_synced_at),
+            )
+
+    # ------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------
+
+    def get_sync_state(self, scope):
+        """
+        取得 scope 的同步狀態
+
+        Returns:
+            {'last_updated_at', 'synced_at', 'full_synced_at'} 或 None（從未同步）
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT last_updated_at, synced_at, full_synced_at FROM sync_state WHERE scope = ?',
+                (scope,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def scopes(self):
+        """曾經同步過的 scope 列表"""
+        with self._lock:
+            rows = self._conn.execute('SELECT scope FROM sync_state ORDER BY scope').fetchall()
+        return [row['scope'] for row in rows]
+
+    def iter_products(self, scope=ALL_PRODUCTS_SCOPE, batch_size=500):
+        """
+        逐批讀取 scope 內的商品（按上架時間排序，新的優先）
+        每批讀完就釋放，不會一次把整個系列載入記憶體
+
+        Yields:
+            商品 dict
+        """
+        # 走 idx_memberships_newest：依序讀索引，每批只讀 batch_size 筆，不必排序
+        select = (
+            'SELECT m.product_id AS id, m.created_at, p.data FROM memberships m '
+            'JOIN products p ON p.id = m.product_id '
+            'WHERE m.scope = ? {} '
+            'ORDER BY m.created_at DESC, m.product_id DESC LIMIT ?'
+        )
+        last = None
+        while True:
+            with self._lock:
+                if last is None:
+                    rows = self._conn.execute(select.format(''), (scope, batch_size)).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        select.format('AND (m.created_at, m.product_id) < (?, ?)'),
+                        (scope, last[0], last[1], batch_size),
+                    ).fetchall()
+
+            for row in rows:
+                yield json.loads(row['data'])
+
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1]['created_at'], rows[-1]['id'])
+
+    def get_newest_products(self, scope, n):
+        """scope 內最新上架的前 n 個商品（依 idx_memberships_newest 索引順序，只讀 n 筆）"""
+        if n <= 0:
+            return []
+        return list(islice(self.iter_products(scope, batch_size=n), n))
+
+    def get_products(self, scope=ALL_PRODUCTS_SCOPE):
+        """
+        取得 scope 內所有商品（按上架時間排序，新的優先）
+
+        Returns:
+            商品列表
+        """
+        return list(self.iter_products(scope))
+
+    def get_product(self, product_id):
+        """取得單一商品，不存在時回傳 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM products WHERE id = ?', (int(product_id),)
+            ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def is_member(self, scope, product_id):
+        """商品是否在 scope 內（用主鍵查詢，不需要讀整個系列）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM memberships WHERE scope = ? AND product_id = ?',
+                (scope, int(product_id)),
+            ).fetchone()
+        return row is not None
+
+    def count(self, scope=ALL_PRODUCTS_SCOPE):
+        """scope 內的商品數量"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*) AS n FROM memberships WHERE scope = ?', (scope,)
+            ).fetchone()
+        return row['n']
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -15,6 +15,11 @@ import random
 import os
 from datetime import datetime
 from shopify_client import ShopifyClient
+from shopify_retry import ShopifyError
+from product_query import ProductQuery
+from hashtag_registry import brand_hashtag, type_hashtag
+from exchange_rate import get_jpy_twd_rate
+from catalog_store import CatalogStore
 from social_clients import FacebookClient, InstagramClient, ThreadsClient
 from config import Config
 
@@ -29,49 +34,31 @@ def load_config():
 def get_random_product(shopify, collection_handle=None):
     """隨機取得一個商品"""
     if collection_handle:
-        products = shopify.get_products_from_collection(collection_handle)
+        products = shopify.get_products_from_collection(collection_handle, fields='render')
     else:
-        products = shopify.get_all_products()
+        # 完整目錄用平行分段抓取，邊抓邊抽樣（reservoir sampling），不保留整個目錄
+        # 草稿、封存、未發布的商品直接由 Shopify 排除
+        products = shopify.iter_products(
+            parallel=True, fields='render', query=ProductQuery(status='active', published=True)
+        )
     
-    if not products:
+    product = None
+    for i, p in enumerate(products, 1):
+        if random.randrange(i) == 0:
+            product = p
+    
+    if not product:
         print("❌ 找不到任何商品")
         return None
     
-    return random.choice(products)
+    return product
 
 def get_jpy_to_twd_rate():
     """
     取得日圓對台幣匯率
-    使用免費 API，失敗時用預設值
+    讀共用的匯率快取（過期時在背景更新），還沒有匯率時用預設值
     """
-    import requests
-    
-    # 預設匯率（備用）
-    DEFAULT_RATE = 0.22
-    
-    try:
-        # 使用免費的 exchangerate-api
-        url = "https://api.exchangerate-api.com/v4/latest/JPY"
-        response = requests.get(url, timeout=5)
-        if response.ok:
-            data = response.json()
-            rate = data.get('rates', {}).get('TWD', DEFAULT_RATE)
-            return rate
-    except:
-        pass
-    
-    # 備用 API
-    try:
-        url = "https://open.er-api.com/v6/latest/JPY"
-        response = requests.get(url, timeout=5)
-        if response.ok:
-            data = response.json()
-            rate = data.get('rates', {}).get('TWD', DEFAULT_RATE)
-            return rate
-    except:
-        pass
-    
-    return DEFAULT_RATE
+    return get_jpy_twd_rate()
 
 
 def generate_post_content(product, config):
@@ -149,66 +136,16 @@ def generate_post_content(product, config):
     image_urls = [img.get('src') for img in images if img.get('src')]
     image_url = image_urls[0] if image_urls else None  # 第一張圖（給 Threads 用）
     
-    # 取得商品標籤和類型
-    tags = product.get('tags', [])
-    product_type = product.get('product_type', '')
-    
     # ============================================
     # 動態產生品牌 Hashtag
     # ============================================
-    brand_tag = ''
-    handle_lower = handle.lower()
-    title_lower = title.lower()
-    
-    if 'bape' in handle_lower or 'bape' in title_lower:
-        brand_tag = '#BAPE'
-    elif 'workman' in handle_lower or 'workman' in title_lower:
-        brand_tag = '#WORKMAN'
-    elif 'human-made' in handle_lower or 'human made' in title_lower:
-        brand_tag = '#HUMANMADE'
-    elif 'x-girl' in handle_lower or 'x-girl' in title_lower:
-        brand_tag = '#XGIRL'
-    elif 'yokumoku' in handle_lower:
-        brand_tag = '#YOKUMOKU'
-    elif '小倉山莊' in handle or '小倉山莊' in title:
-        brand_tag = '#小倉山莊'
-    elif '砂糖奶油樹' in handle or '砂糖奶油樹' in title:
-        brand_tag = '#砂糖奶油樹'
-    elif '坂角' in handle or '坂角' in title:
-        brand_tag = '#坂角總本舖'
-    elif '風月堂' in handle or '風月堂' in title:
-        brand_tag = '#神戶風月堂'
-    elif '虎屋' in handle or '虎屋' in title:
-        brand_tag = '#虎屋羊羹'
-    elif '資生堂' in handle or '資生堂' in title:
-        brand_tag = '#資生堂PARLOUR'
-    elif 'francais' in handle_lower or 'français' in title_lower:
-        brand_tag = '#FRANCAIS'
-    elif 'cocoris' in handle_lower:
-        brand_tag = '#COCORIS'
-    elif 'harada' in handle_lower or 'ハラダ' in title:
-        brand_tag = '#GateauFestaHarada'
-    elif 'maple' in handle_lower or '楓糖' in title:
-        brand_tag = '#楓糖男孩'
-    elif '菊廼舍' in handle or '菊廼舍' in title:
-        brand_tag = '#銀座菊廼舍'
+    brand_tag = brand_hashtag(product)
     
     # ============================================
     # 動態產生類型 Hashtag (KIDS/MENS/WOMENS)
     # ============================================
-    type_tag = ''
-    
-    # 從 handle、tags、product_type 判斷
-    all_text = f"{handle_lower} {product_type.lower()} {' '.join(tags).lower()}"
-    
-    if '兒童' in handle or 'kids' in all_text or 'キッズ' in title:
-        type_tag = '#KIDS'
-    elif '男裝' in handle or 'mens' in all_text or 'men' in all_text:
-        type_tag = '#MENS'
-    elif '女裝' in handle or 'womens' in all_text or 'women' in all_text or 'ladies' in all_text:
-        type_tag = '#WOMENS'
-    elif '作業服' in handle:
-        type_tag = '#作業服'
+    # 從 handle、tags、product_type 判斷（同一個商品只正規化一次）
+    type_tag = type_hashtag(product)
     
     # ============================================
     # 組合 Hashtag (給 FB/IG 用)
@@ -355,6 +292,50 @@ def list_collections(shopify):
         print(f"  • {col['title']} (handle: {col['handle']})")
     print()
 
+def publish_product(product, config, args):
+    """預覽並發布單一商品的貼文"""
+    print(f"\n📦 選中商品: {product.get('title')}")
+    
+    # 生成貼文內容
+    content = generate_post_content(product, config)
+    
+    print("\n📝 貼文預覽（FB/IG 版本，有 hashtag）：")
+    print("-" * 40)
+    print(content['text'])
+    print("-" * 40)
+    
+    print("\n📝 貼文預覽（Threads 版本，無 hashtag）：")
+    print("-" * 40)
+    print(content.get('text_no_tags', content['text']))
+    print("-" * 40)
+    
+    image_urls = content.get('image_urls', [])
+    if image_urls:
+        print(f"\n🖼️  圖片數量: {len(image_urls)} 張")
+        for i, url in enumerate(image_urls[:5], 1):
+            print(f"   {i}. {url[:50]}...")
+        if len(image_urls) > 5:
+            print(f"   ... 還有 {len(image_urls) - 5} 張")
+    
+    # 發布
+    platforms = [p.strip().lower() for p in args.platforms.split(',')]
+    
+    if args.dry_run:
+        print("\n⚠️  測試模式 - 不會實際發文")
+        print(f"   預計發布平台: {', '.join(platforms)}")
+        if len(image_urls) > 1:
+            print(f"   FB/IG/Threads: 多圖貼文（{len(image_urls)} 張）")
+        else:
+            print(f"   FB/IG/Threads: 單圖貼文")
+    else:
+        print(f"\n🚀 開始發布到: {', '.join(platforms)}")
+        results = post_to_platforms(content, platforms, config)
+        
+        print("\n📊 發布結果：")
+        for platform, result in results.items():
+            status = "✅ 成功" if result['success'] else "❌ 失敗"
+            print(f"   {platform}: {status}")
+
 def main():
     parser = argparse.ArgumentParser(description='御用達社群自動發文系統')
     parser.add_argument('--random', action='store_true', help='隨機選擇商品')
@@ -363,7 +344,7 @@ def main():
                         help='發布平台 (逗號分隔: fb,ig,threads)')
     parser.add_argument('--list-collections', action='store_true', help='列出所有系列')
     parser.add_argument('--dry-run', action='store_true', help='測試模式，不實際發文')
-    parser.add_argument('--product-id', type=str, help='指定特定商品 ID')
+    parser.add_argument('--product-id', type=str, help='指定特定商品 ID（多個用逗號分隔）')
     
     # 智慧選擇相關參數
     parser.add_argument('--smart', action='store_true', 
@@ -378,6 +359,14 @@ def main():
     
     args = parser.parse_args()
     
+    # 商品 ID 先檢查格式，打錯時顯示用法而不是 traceback
+    product_ids = []
+    if args.product_id:
+        product_ids = [pid.strip() for pid in args.product_id.split(',') if pid.strip()]
+        invalid = [pid for pid in product_ids if not pid.isdigit()]
+        if invalid or not product_ids:
+            parser.error(f"--product-id 必須是數字商品 ID（多個用逗號分隔）: {', '.join(invalid) or args.product_id}")
+    
     print("=" * 50)
     print("🎌 御用達 GOYOUTATI - 社群自動發文系統")
     print("=" * 50)
@@ -391,7 +380,8 @@ def main():
     # 初始化 Shopify 客戶端
     shopify = ShopifyClient(
         store_url=config.SHOPIFY_STORE_URL,
-        access_token=config.SHOPIFY_ACCESS_TOKEN
+        access_token=config.SHOPIFY_ACCESS_TOKEN,
+        catalog=CatalogStore(config.CATALOG_DB_PATH)
     )
     
     # 列出系列
@@ -435,24 +425,23 @@ def main():
     # 智慧選擇模式
     if args.smart:
         from smart_selector import SmartSelector
-        selector = SmartSelector(shopify, config)
+        # generate_post_content 會用到 body_html / product_type
+        selector = SmartSelector(shopify, config, fields='render')
         platforms = [p.strip().lower() for p in args.platforms.split(',')]
         
         print(f"🧠 智慧選擇模式：計劃發 {args.count} 篇文章")
         print()
         
-        for i in range(args.count):
+        # 一次選出這批要發的商品（不會重複）
+        picks = selector.get_next_products(args.count, args.category)
+        if not picks:
+            print("❌ 沒有可發布的商品了")
+        
+        for i, (product, category) in enumerate(picks):
             print(f"\n{'='*40}")
-            print(f"📝 第 {i+1}/{args.count} 篇")
+            print(f"📝 第 {i+1}/{len(picks)} 篇")
             print(f"{'='*40}")
             
-            # 取得下一個商品
-            product, category = selector.get_next_product(args.category)
-            
-            if not product:
-                print("❌ 沒有可發布的商品了")
-                break
-            
             category_name = '伴手禮' if category == 'souvenir' else '服飾'
             print(f"   類別: {category_name}")
             print(f"   商品: {product.get('title')}")
@@ -490,7 +479,7 @@ def main():
                 
                 # 標記已發文
                 if all_success:
-                    if selector.mark_as_posted(product, category):
+                    if selector.mark_as_posted(product, category, results):
                         print(f"   🏷️  已標記為已發文")
                     else:
                         print(f"   ⚠️  標記失敗")
@@ -509,8 +498,21 @@ def main():
     product = None
     
     if args.product_id:
-        print(f"🔍 取得指定商品: {args.product_id}")
-        product = shopify.get_product_by_id(args.product_id)
+        if len(product_ids) > 1:
+            # 多個商品：每 250 個一次請求，不必逐一查詢
+            print(f"🔍 取得指定商品: {len(product_ids)} 個")
+            products, missing = shopify.get_products_by_ids(product_ids, fields='render')
+            for pid in missing:
+                print(f"   ⚠️  找不到商品: {pid}")
+            for i, product in enumerate(products, 1):
+                print(f"\n{'='*40}")
+                print(f"📝 第 {i}/{len(products)} 篇")
+                print(f"{'='*40}")
+                publish_product(product, config, args)
+            print("\n✨ 完成！")
+            return
+        print(f"🔍 取得指定商品: {product_ids[0]}")
+        product = shopify.get_product_by_id(product_ids[0], fields='render')
     elif args.collection:
         print(f"🔍 從系列 [{args.collection}] 隨機選擇商品...")
         product = get_random_product(shopify, args.collection)
@@ -525,49 +527,13 @@ def main():
         print("❌ 無法取得商品")
         return
     
-    print(f"\n📦 選中商品: {product.get('title')}")
-    
-    # 生成貼文內容
-    content = generate_post_content(product, config)
-    
-    print("\n📝 貼文預覽（FB/IG 版本，有 hashtag）：")
-    print("-" * 40)
-    print(content['text'])
-    print("-" * 40)
-    
-    print("\n📝 貼文預覽（Threads 版本，無 hashtag）：")
-    print("-" * 40)
-    print(content.get('text_no_tags', content['text']))
-    print("-" * 40)
-    
-    image_urls = content.get('image_urls', [])
-    if image_urls:
-        print(f"\n🖼️  圖片數量: {len(image_urls)} 張")
-        for i, url in enumerate(image_urls[:5], 1):
-            print(f"   {i}. {url[:50]}...")
-        if len(image_urls) > 5:
-            print(f"   ... 還有 {len(image_urls) - 5} 張")
-    
-    # 發布
-    platforms = [p.strip().lower() for p in args.platforms.split(',')]
-    
-    if args.dry_run:
-        print("\n⚠️  測試模式 - 不會實際發文")
-        print(f"   預計發布平台: {', '.join(platforms)}")
-        if len(image_urls) > 1:
-            print(f"   FB/IG/Threads: 多圖貼文（{len(image_urls)} 張）")
-        else:
-            print(f"   FB/IG/Threads: 單圖貼文")
-    else:
-        print(f"\n🚀 開始發布到: {', '.join(platforms)}")
-        results = post_to_platforms(content, platforms, config)
-        
-        print("\n📊 發布結果：")
-        for platform, result in results.items():
-            status = "✅ 成功" if result['success'] else "❌ 失敗"
-            print(f"   {platform}: {status}")
+    publish_product(product, config, args)
     
     print("\n✨ 完成！")
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except ShopifyError as e:
+        print(f"❌ Shopify API 錯誤: {e}")
+        raise SystemExit(1)
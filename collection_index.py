@@ -0,0 +1,158 @@
+"""
+系列索引
+把 custom / smart collections 依 handle、正規化後的標題、ID 建立對照表，
+過期時在背景重新整理，查詢系列時不需要再打 Shopify API
+"""
+
+import threading
+import time
+import unicodedata
+
+# 索引多久後視為過期（過期仍先回傳舊資料，同時在背景更新）
+COLLECTION_INDEX_TTL = 30 * 60
+
+
+def normalize_title(title):
+    """
+    正規化系列標題，用來比對名稱
+    全形轉半形、去掉重音符號、忽略大小寫、空白與標點
+    （FRANÇAIS = FRANCAIS、work man 作業服 = WORKMAN 作業服）
+    """
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ''.join(ch for ch in text.casefold() if ch.isalnum())
+
+
+class CollectionIndex:
+    """系列對照表（thread-safe，可被多個 ShopifyClient 共用）"""
+
+    def __init__(self, loader, ttl=COLLECTION_INDEX_TTL):
+        """
+        Args:
+            loader: 回傳完整系列列表的函式（失敗時回傳 None）
+            ttl: 過期秒數
+        """
+        self._loader = loader
+        self.ttl = ttl
+        self._by_handle = {}
+        self._by_title = {}
+        self._by_id = {}
+        self._loaded_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def set_loader(self, loader):
+        """換成較新的 client 來載入（舊的 client 可能已經不用了）"""
+        self._loader = loader
+
+    def refresh(self):
+        """同步重新載入，成功時回傳 True"""
+        with self._load_lock:
+            collections = self._loader()
+            if collections is None:
+                return False
+
+            by_handle, by_title, by_id = {}, {}, {}
+            for col in collections:
+                if col.get('handle'):
+                    by_handle[col['handle']] = col
+                if col.get('title'):
+                    by_title.setdefault(normalize_title(col['title']), col)
+                if col.get('id'):
+                    by_id[int(col['id'])] = col
+
+            with self._lock:
+                self._by_handle, self._by_title, self._by_id = by_handle, by_title, by_id
+                self._loaded_at = time.time()
+            return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[CollectionIndex] 背景更新失敗: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+    def _ensure_loaded(self):
+        with self._lock:
+            loaded_at = self._loaded_at
+
+        if loaded_at is None:
+            # 第一次使用：只能同步載入
+            self.refresh()
+        elif time.time() - loaded_at > self.ttl:
+            self._refresh_in_background()
+
+    def invalidate(self):
+        """標記為過期，下次查詢時在背景重新載入"""
+        with self._lock:
+            if self._loaded_at is not None:
+                self._loaded_at = 0
+
+    def get_by_handle(self, handle):
+        self._ensure_loaded()
+        with self._lock:
+            return self._by_handle.get(handle)
+
+    def get_by_title(self, title):
+        self._ensure_loaded()
+        with self._lock:
+            return self._by_title.get(normalize_title(title))
+
+    def get_by_id(self, collection_id):
+        self._ensure_loaded()
+        with self._lock:
+            return self._by_id.get(int(collection_id))
+
+    def resolve(self, key):
+        """
+        依序用 handle、標題、ID 找系列
+
+        Returns:
+            系列 dict，找不到時回傳 None
+        """
+        collection = self.get_by_handle(key) or self.get_by_title(key)
+        if collection is None and str(key).isdigit():
+            collection = self.get_by_id(key)
+        return collection
+
+    def all(self):
+        """目前索引中的所有系列"""
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._by_id.values()) or list(self._by_handle.values())
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_collection_index(store_url, loader, admin=True):
+    """
+    取得商店共用的系列索引（同一個 process 內只會有一個）
+
+    Args:
+        store_url: 商店網址
+        loader: 回傳完整系列列表的函式
+        admin: 是否為 Admin API 的資料（Storefront 的系列沒有 ID，分開存）
+    """
+    key = (store_url.rstrip('/').lower(), bool(admin))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = CollectionIndex(loader)
+        else:
+            index.set_loader(loader)
+        return index
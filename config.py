@@ -97,10 +97,45 @@ class Config:
     ).split(',')
     FASHION_COLLECTIONS = [c.strip() for c in FASHION_COLLECTIONS if c.strip()]
     
-    # 發文標籤前綴
+    # 發文標籤前綴（舊版用 Shopify 標籤記錄輪次，現在改用本機發文記錄）
     SOUVENIR_POSTED_TAG = '伴手禮已發-輪次'
     FASHION_POSTED_TAG = '服飾已發-輪次'
     
+    # ============================================
+    # 本機資料設定
+    # ============================================
+    # 本機資料（SQLite 快照等）存放的資料夾
+    DATA_DIR = os.getenv('DATA_DIR', '.')
+    
+    # 本機商品快照檔案
+    CATALOG_DB_PATH = os.getenv('CATALOG_DB_PATH', os.path.join(DATA_DIR, 'catalog.db'))
+    
+    # 本機發文記錄檔案（商品、平台、時間、貼文 ID、輪次）
+    POST_HISTORY_DB_PATH = os.getenv('POST_HISTORY_DB_PATH', os.path.join(DATA_DIR, 'post_history.db'))
+    
+    # 後台統計的快取檔案（所有 worker 共用）與過期秒數
+    # （過期後先回傳舊的統計，同時在背景更新）
+    STATS_CACHE_PATH = os.getenv('STATS_CACHE_PATH', os.path.join(DATA_DIR, 'stats_cache.json'))
+    STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '60'))
+    
+    # AI 文案（opinion / wishlist）快取檔案、保留秒數與最多保留幾筆（超過時淘汰最久沒用到的）
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(DATA_DIR, 'llm_cache.db'))
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 60 * 60)))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '2000'))
+    
+    # 設為 true 時一律重新產生 AI 文案（不讀快取，但仍會寫入）
+    LLM_CACHE_BYPASS = os.getenv('LLM_CACHE_BYPASS', 'false').lower() == 'true'
+    
+    # 匯率快取檔案（所有 worker 共用）
+    EXCHANGE_RATE_CACHE_PATH = os.getenv('EXCHANGE_RATE_CACHE_PATH', os.path.join(DATA_DIR, 'exchange_rates.json'))
+    
+    # 是否已在 Shopify 設定商品 / 系列的更新、刪除 Webhook
+    # （快照由 Webhook 即時更新，定期增量同步只用來補漏，間隔可以拉長）
+    CATALOG_WEBHOOKS = os.getenv('CATALOG_WEBHOOKS', 'false').lower() == 'true'
+    
+    # 快照超過幾秒就先向 Shopify 做增量同步
+    CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', '3600' if CATALOG_WEBHOOKS else '300'))
+    
     def validate(self):
         """驗證設定是否完整"""
         errors = []
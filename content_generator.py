@@ -15,9 +15,15 @@ content_generator.py
 
 import os
 import re
+import sqlite3
 import requests
 from datetime import datetime
 
+from config import Config
+from exchange_rate import get_jpy_twd_rate
+from hashtag_registry import brand_hashtag
+from llm_cache import get_llm_cache, response_key, template_hash
+
 # ============================================================
 # 每日發文類型排班
 # 0=週一 … 6=週日
@@ -51,13 +57,13 @@ def _strip_html(html: str) -> str:
 
 def _get_price_line(product: dict) -> str:
     """計算價格並格式化"""
-    DEFAULT_RATE = 0.22
     variants = product.get('variants', [])
     price_jpy_str = variants[0].get('price', '0') if variants else '0'
     try:
         price_jpy = float(price_jpy_str)
         if price_jpy > 0:
-            rate = _fetch_jpy_twd_rate(DEFAULT_RATE)
+            # 只讀共用的匯率快取，不等外部 API
+            rate = get_jpy_twd_rate()
             price_twd = int(price_jpy * rate)
             return f"💰 ¥{int(price_jpy):,}（約NT${price_twd:,}）"
     except Exception:
@@ -65,49 +71,9 @@ def _get_price_line(product: dict) -> str:
     return "💰 價格請詢價"
 
 
-def _fetch_jpy_twd_rate(default: float) -> float:
-    for url in [
-        "https://api.exchangerate-api.com/v4/latest/JPY",
-        "https://open.er-api.com/v6/latest/JPY",
-    ]:
-        try:
-            r = requests.get(url, timeout=5)
-            if r.ok:
-                return r.json().get('rates', {}).get('TWD', default)
-        except Exception:
-            pass
-    return default
-
-
 def _get_brand_hashtag(product: dict) -> str:
-    """從商品 handle / title 自動抽品牌 hashtag"""
-    handle = product.get('handle', '').lower()
-    title  = product.get('title', '')
-    checks = [
-        ('bape',        '#BAPE'),
-        ('workman',     '#WORKMAN'),
-        ('human-made',  '#HumanMade'),
-        ('human made',  '#HumanMade'),
-        ('x-girl',      '#Xgirl'),
-        ('yokumoku',    '#YOKUMOKU'),
-        ('adidas',      '#adidas'),
-        ('nike',        '#Nike'),
-        ('uniqlo',      '#UNIQLO'),
-        ('muji',        '#MUJI'),
-        ('小倉山莊',    '#小倉山莊'),
-        ('砂糖奶油樹',  '#砂糖奶油樹'),
-        ('坂角',        '#坂角總本舖'),
-        ('風月堂',      '#神戶風月堂'),
-        ('虎屋',        '#虎屋羊羹'),
-        ('資生堂',      '#資生堂PARLOUR'),
-        ('菊廼舍',      '#銀座菊廼舍'),
-        ('楓糖',        '#楓糖男孩'),
-    ]
-    combined = f"{handle} {title.lower()}"
-    for kw, tag in checks:
-        if kw in combined:
-            return tag
-    return ''
+    """從商品 handle / title 自動抽品牌 hashtag（與 cli 共用 hashtag_registry）"""
+    return brand_hashtag(product)
 
 
 def _get_images(product: dict):
@@ -138,6 +104,10 @@ GOYOUTATI 御用達幫你代購，空運含稅直送台灣。
 # Claude API 呼叫
 # ============================================================
 
+CLAUDE_MODEL = 'claude-sonnet-4-20250514'
+CLAUDE_MAX_TOKENS = 600
+
+
 def _call_claude(prompt: str, system: str = '') -> str | None:
     api_key = os.getenv('ANTHROPIC_API_KEY', '')
     if not api_key:
@@ -150,8 +120,8 @@ def _call_claude(prompt: str, system: str = '') -> str | None:
         'content-type': 'application/json',
     }
     body = {
-        'model': 'claude-sonnet-4-20250514',
-        'max_tokens': 600,
+        'model': CLAUDE_MODEL,
+        'max_tokens': CLAUDE_MAX_TOKENS,
         'system': system,
         'messages': [{'role': 'user', 'content': prompt}],
     }
@@ -167,11 +137,47 @@ def _call_claude(prompt: str, system: str = '') -> str | None:
         return None
 
 
+def _call_claude_cached(product: dict, post_type: str, prompt: str, system: str = '',
+                        bypass_cache: bool = False) -> str | None:
+    """
+    同一個商品版本 + 同一份 prompt 只呼叫一次 Claude，之後從快取取得
+
+    Args:
+        bypass_cache: True = 不讀快取，一律重新產生（結果仍會寫入快取）
+    """
+    try:
+        cache = get_llm_cache()
+    except (OSError, sqlite3.Error) as e:
+        print(f"[content_generator] ⚠️  文案快取無法使用: {e}")
+        return _call_claude(prompt, system)
+
+    key = response_key(product, post_type, template_hash(CLAUDE_MODEL, CLAUDE_MAX_TOKENS, system, prompt))
+    if not (bypass_cache or Config.LLM_CACHE_BYPASS):
+        try:
+            text = cache.get(key)
+        except sqlite3.Error as e:
+            # 資料庫鎖住、磁碟滿、檔案損毀：當成沒有快取
+            print(f"[content_generator] ⚠️  讀取文案快取失敗，重新產生: {e}")
+            text = None
+        if text is not None:
+            print(f"[content_generator] ♻️  使用快取的 {post_type} 文案")
+            return text
+
+    text = _call_claude(prompt, system)
+    if text:
+        try:
+            cache.put(key, text, product_id=product.get('id'), post_type=post_type)
+        except sqlite3.Error as e:
+            # 文案已經產生好了，寫不進快取也照樣使用
+            print(f"[content_generator] ⚠️  寫入文案快取失敗: {e}")
+    return text
+
+
 # ============================================================
 # 各類型文案生成
 # ============================================================
 
-def _generate_opinion_text(product: dict) -> str | None:
+def _generate_opinion_text(product: dict, bypass_cache: bool = False) -> str | None:
     """
     觀點文：帶犀利觀點、引發討論，不直接推銷
     返回純文字（無 hashtag、無價格、無 URL）
@@ -203,10 +209,10 @@ def _generate_opinion_text(product: dict) -> str | None:
 - 不超過 380 字
 - 直接輸出文章本文，不要有標題或前言"""
 
-    return _call_claude(prompt, system)
+    return _call_claude_cached(product, 'opinion', prompt, system, bypass_cache)
 
 
-def _generate_wishlist_text(product: dict) -> str | None:
+def _generate_wishlist_text(product: dict, bypass_cache: bool = False) -> str | None:
     """
     許願互動文：以商品為引子，讓讀者留言說想代購什麼
     返回純文字（無 hashtag、無價格、無 URL）
@@ -229,16 +235,17 @@ def _generate_wishlist_text(product: dict) -> str | None:
 - 不超過 280 字
 - 直接輸出文章本文，不要有標題或前言"""
 
-    return _call_claude(prompt, system)
+    return _call_claude_cached(product, 'wishlist', prompt, system, bypass_cache)
 
 
 # ============================================================
 # 主要對外函式
 # ============================================================
 
-def build_post_content(product: dict, config, post_type: str = 'product') -> dict:
+def build_post_content(product: dict, config, post_type: str = 'product', bypass_cache: bool = False) -> dict:
     """
     根據 post_type 生成完整的貼文內容字典。
+    opinion / wishlist 的 AI 文案會快取（同商品版本、同 prompt），bypass_cache=True 時重新產生。
     
     回傳格式與原本 generate_post_content() 相同，可直接傳給 post_to_platforms()：
     {
@@ -261,13 +268,13 @@ def build_post_content(product: dict, config, post_type: str = 'product') -> dic
 
     # ── opinion / wishlist：用 Claude 生成主體文 ──────────
     if post_type == 'opinion':
-        body = _generate_opinion_text(product)
+        body = _generate_opinion_text(product, bypass_cache)
         if not body:
             print(f"[content_generator] opinion 生成失敗，改用 product 類型")
             post_type = 'product'
 
     if post_type == 'wishlist':
-        body = _generate_wishlist_text(product)
+        body = _generate_wishlist_text(product, bypass_cache)
         if not body:
             print(f"[content_generator] wishlist 生成失敗，改用 product 類型")
             post_type = 'product'
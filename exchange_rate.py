@@ -0,0 +1,89 @@
+"""
+日圓匯率服務
+匯率存在共用的快取檔（所有 worker 共用），過期時在背景更新；
+更新時同時查詢所有來源，用最先回來的有效結果。
+產生貼文時只讀快取，不會等外部 API（還沒有匯率時用預設值）
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from config import Config
+from shared_cache import get_shared_cache
+
+# 還沒有取得匯率時使用的日圓對台幣匯率
+DEFAULT_JPY_TWD_RATE = 0.22
+
+# 匯率來源（回傳 {'rates': {'TWD': ...}}）
+EXCHANGE_RATE_SOURCES = (
+    "https://api.exchangerate-api.com/v4/latest/JPY",
+    "https://open.er-api.com/v6/latest/JPY",
+)
+
+# 匯率多久更新一次（秒），以及每個來源的逾時
+EXCHANGE_RATE_TTL = 6 * 60 * 60
+EXCHANGE_RATE_TIMEOUT = 5
+
+# 查詢來源用的 thread（慢的來源在背景跑完即可，不必等）
+_source_pool = ThreadPoolExecutor(max_workers=len(EXCHANGE_RATE_SOURCES) * 2)
+
+
+def _fetch_source(url):
+    """向一個來源查詢日圓匯率，回傳 {'TWD': ...}"""
+    response = requests.get(url, timeout=EXCHANGE_RATE_TIMEOUT)
+    response.raise_for_status()
+    rates = response.json().get('rates') or {}
+    twd = rates.get('TWD')
+    if not isinstance(twd, (int, float)) or twd <= 0:
+        raise ValueError(f"匯率資料沒有 TWD: {url}")
+    return {'TWD': float(twd)}
+
+
+def fetch_jpy_rates(sources=EXCHANGE_RATE_SOURCES):
+    """
+    同時查詢所有來源，回傳最先成功的結果
+
+    Returns:
+        {'rates': {'TWD': ...}, 'source': url, 'fetched_at': time.time()}
+
+    Raises:
+        RuntimeError: 所有來源都失敗
+    """
+    futures = {_source_pool.submit(_fetch_source, url): url for url in sources}
+
+    errors = []
+    for future in as_completed(futures):
+        try:
+            rates = future.result()
+        except Exception as e:
+            errors.append(f"{futures[future]}: {e}")
+            continue
+        return {'rates': rates, 'source': futures[future], 'fetched_at': time.time()}
+    raise RuntimeError(f"所有匯率來源都失敗（{'; '.join(errors)}）")
+
+
+def get_exchange_rate_cache(path=None, ttl=EXCHANGE_RATE_TTL):
+    """匯率的共用快取（所有 worker 同時最多一個在更新）"""
+    return get_shared_cache(path or Config.EXCHANGE_RATE_CACHE_PATH, fetch_jpy_rates, ttl)
+
+
+def get_jpy_twd_rate(default=DEFAULT_JPY_TWD_RATE):
+    """
+    取得日圓對台幣匯率（不會等待外部 API）
+
+    Args:
+        default: 還沒有取得匯率時使用的值
+
+    Returns:
+        匯率（float）
+    """
+    try:
+        cached = get_exchange_rate_cache().peek()
+    except OSError as e:
+        print(f"[ExchangeRate] 無法讀取匯率快取，使用預設值: {e}")
+        return default
+    if not cached:
+        return default
+    return cached.get('rates', {}).get('TWD', default)
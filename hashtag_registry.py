@@ -0,0 +1,220 @@
+"""
+品牌 / 類型 Hashtag 對照表
+所有產生貼文的地方（content_generator、cli）共用同一份對照表；
+品牌關鍵字編譯成一個正規表示式，每個商品只掃一次 handle 與標題，
+同時命中多個品牌時依對照表的順序（優先順序）決定
+
+效能比較（用本機快照或隨機產生的商品）：
+  python hashtag_registry.py [catalog.db]
+"""
+
+import re
+
+from tag_index import product_keywords
+
+# 品牌 Hashtag：(hashtag, 關鍵字)，越前面優先順序越高
+# 關鍵字比對小寫的 handle 與標題（部分字串即可）
+BRAND_HASHTAGS = (
+    ('#BAPE', ('bape',)),
+    ('#WORKMAN', ('workman',)),
+    ('#HUMANMADE', ('human-made', 'human made')),
+    ('#XGIRL', ('x-girl',)),
+    ('#YOKUMOKU', ('yokumoku',)),
+    ('#小倉山莊', ('小倉山莊',)),
+    ('#砂糖奶油樹', ('砂糖奶油樹',)),
+    ('#坂角總本舖', ('坂角',)),
+    ('#神戶風月堂', ('風月堂',)),
+    ('#虎屋羊羹', ('虎屋',)),
+    ('#資生堂PARLOUR', ('資生堂',)),
+    ('#FRANCAIS', ('francais', 'français')),
+    ('#COCORIS', ('cocoris',)),
+    ('#GateauFestaHarada', ('harada', 'ハラダ')),
+    ('#楓糖男孩', ('maple', '楓糖')),
+    ('#銀座菊廼舍', ('菊廼舍',)),
+    ('#adidas', ('adidas',)),
+    ('#Nike', ('nike',)),
+    ('#UNIQLO', ('uniqlo',)),
+    ('#MUJI', ('muji',)),
+)
+
+# 類型 Hashtag：(hashtag, 英文關鍵字, handle / 標題中的中日文關鍵字)，依序比對
+# 英文用完整關鍵字比對（women 不會被當成 men）
+TYPE_HASHTAGS = (
+    ('#KIDS', frozenset({'kids', 'kid'}), ('兒童', 'キッズ')),
+    ('#MENS', frozenset({'mens', 'men'}), ('男裝',)),
+    ('#WOMENS', frozenset({'womens', 'women', 'ladies'}), ('女裝',)),
+    ('#作業服', frozenset(), ('作業服',)),
+)
+
+
+class BrandMatcher:
+    """把品牌關鍵字編譯成一個正規表示式，一次掃描找出優先順序最高的品牌"""
+
+    def __init__(self, brands):
+        """
+        Args:
+            brands: [(hashtag, 關鍵字...), ...]，越前面優先順序越高
+        """
+        self._keywords = {}  # 關鍵字 → (優先順序, hashtag)
+        for priority, (hashtag, keywords) in enumerate(brands):
+            for keyword in keywords:
+                self._keywords.setdefault(keyword.lower(), (priority, hashtag))
+
+        # 同一個位置較長的關鍵字先比對
+        self._pattern = re.compile('|'.join(
+            re.escape(k) for k in sorted(self._keywords, key=len, reverse=True)
+        ))
+
+    def match(self, text):
+        """
+        找出文字中優先順序最高的品牌
+
+        Args:
+            text: 小寫的 handle / 標題
+
+        Returns:
+            hashtag，沒有品牌時回傳空字串
+        """
+        best = None
+        pos = 0
+        while True:
+            # 從上一個命中的下一個字元繼續找，重疊的關鍵字也不會漏掉
+            m = self._pattern.search(text, pos)
+            if m is None:
+                break
+            candidate = self._keywords[m.group()]
+            if best is None or candidate < best:
+                best = candidate
+                if best[0] == 0:
+                    break
+            pos = m.start() + 1
+        return best[1] if best else ''
+
+
+_brand_matcher = BrandMatcher(BRAND_HASHTAGS)
+
+
+def brand_hashtag(product):
+    """
+    從商品 handle / 標題判斷品牌 Hashtag
+
+    Returns:
+        Hashtag 字串，判斷不出來時回傳空字串
+    """
+    handle = product.get('handle') or ''
+    title = product.get('title') or ''
+    return _brand_matcher.match(f"{handle.lower()}\n{title.lower()}")
+
+
+def type_hashtag(product):
+    """
+    依 handle / 類型 / 標籤判斷 KIDS、MENS、WOMENS 等類型 Hashtag
+    中日文關鍵字比對 handle 與標題
+
+    Returns:
+        Hashtag 字串，判斷不出來時回傳空字串
+    """
+    keywords = product_keywords(product)
+    handle = product.get('handle') or ''
+    title = product.get('title') or ''
+    for hashtag, words, cjk_words in TYPE_HASHTAGS:
+        if not words.isdisjoint(keywords):
+            return hashtag
+        if any(w in handle or w in title for w in cjk_words):
+            return hashtag
+    return ''
+
+
+# ============================================================
+# 效能比較
+# ============================================================
+
+def _legacy_cli_brand(product):
+    """原本 cli.generate_post_content 的 if/elif（比較用）"""
+    handle = product.get('handle', '')
+    title = product.get('title', '')
+    handle_lower, title_lower = handle.lower(), title.lower()
+    checks = (
+        ('bape' in handle_lower or 'bape' in title_lower, '#BAPE'),
+        ('workman' in handle_lower or 'workman' in title_lower, '#WORKMAN'),
+        ('human-made' in handle_lower or 'human made' in title_lower, '#HUMANMADE'),
+        ('x-girl' in handle_lower or 'x-girl' in title_lower, '#XGIRL'),
+        ('yokumoku' in handle_lower, '#YOKUMOKU'),
+        ('小倉山莊' in handle or '小倉山莊' in title, '#小倉山莊'),
+        ('砂糖奶油樹' in handle or '砂糖奶油樹' in title, '#砂糖奶油樹'),
+        ('坂角' in handle or '坂角' in title, '#坂角總本舖'),
+        ('風月堂' in handle or '風月堂' in title, '#神戶風月堂'),
+        ('虎屋' in handle or '虎屋' in title, '#虎屋羊羹'),
+        ('資生堂' in handle or '資生堂' in title, '#資生堂PARLOUR'),
+        ('francais' in handle_lower or 'français' in title_lower, '#FRANCAIS'),
+        ('cocoris' in handle_lower, '#COCORIS'),
+        ('harada' in handle_lower or 'ハラダ' in title, '#GateauFestaHarada'),
+        ('maple' in handle_lower or '楓糖' in title, '#楓糖男孩'),
+        ('菊廼舍' in handle or '菊廼舍' in title, '#銀座菊廼舍'),
+    )
+    for hit, tag in checks:
+        if hit:
+            return tag
+    return ''
+
+
+def _legacy_content_brand(product):
+    """原本 content_generator._get_brand_hashtag 的迴圈（比較用）"""
+    combined = f"{product.get('handle', '').lower()} {product.get('title', '').lower()}"
+    for keyword, tag in (('bape', '#BAPE'), ('workman', '#WORKMAN'), ('human-made', '#HumanMade'),
+                         ('human made', '#HumanMade'), ('x-girl', '#Xgirl'), ('yokumoku', '#YOKUMOKU'),
+                         ('adidas', '#adidas'), ('nike', '#Nike'), ('uniqlo', '#UNIQLO'), ('muji', '#MUJI'),
+                         ('小倉山莊', '#小倉山莊'), ('砂糖奶油樹', '#砂糖奶油樹'), ('坂角', '#坂角總本舖'),
+                         ('風月堂', '#神戶風月堂'), ('虎屋', '#虎屋羊羹'), ('資生堂', '#資生堂PARLOUR'),
+                         ('菊廼舍', '#銀座菊廼舍'), ('楓糖', '#楓糖男孩')):
+        if keyword in combined:
+            return tag
+    return ''
+
+
+def _sample_products(n=20000, branded=0.4):
+    """隨機商品：一般字詞組成，其中 branded 比例帶一個品牌關鍵字"""
+    import random
+    words = ['tee', 'hoodie', 'cap', 'cookie', 'gift', 'box', 'mens', 'womens', 'kids', '限定', '禮盒',
+             'japan', 'cotton', 'set', 'limited', '2024', '餅乾', '紙袋', 'black', 'white']
+    brands = [k for _, keywords in BRAND_HASHTAGS for k in keywords]
+    rng = random.Random(0)
+    products = []
+    for i in range(n):
+        picked = rng.sample(words, 4)
+        if rng.random() < branded:
+            picked.insert(rng.randrange(5), rng.choice(brands))
+        products.append({'id': i, 'handle': '-'.join(picked) + f'-{i}', 'title': ' '.join(picked).title()})
+    return products
+
+
+def _benchmark(db_path=None):
+    import time
+
+    if db_path:
+        from catalog_store import CatalogStore
+        products = list(CatalogStore(db_path).iter_products())
+        source = db_path
+    else:
+        products = _sample_products()
+        source = '隨機產生'
+    print(f"商品數：{len(products)}（{source}）")
+
+    def run(name, fn):
+        started = time.perf_counter()
+        for product in products:
+            fn(product)
+        elapsed = time.perf_counter() - started
+        print(f"  {name:<28} {elapsed * 1000:8.1f} ms（{elapsed / max(len(products), 1) * 1e6:.2f} µs/個）")
+
+    run('cli if/elif', _legacy_cli_brand)
+    run('content_generator 迴圈', _legacy_content_brand)
+    run('brand_hashtag', brand_hashtag)
+
+    differs = sum(1 for p in products if brand_hashtag(p).lower() != _legacy_cli_brand(p).lower())
+    print(f"  與 cli 結果不同：{differs} 個（新增品牌、或命中多個品牌時依優先順序）")
+
+
+if __name__ == '__main__':
+    import sys
+    _benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
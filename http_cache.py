@@ -0,0 +1,113 @@
+"""
+HTTP 條件式請求快取
+記住 GET 回應的 ETag / Last-Modified，下次送 If-None-Match / If-Modified-Since，
+Shopify 回 304 時直接用本機存的內容，不必重新下載
+"""
+
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+# 快取總容量（位元組），超過時淘汰最久沒用到的項目
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# 單一回應超過總容量的這個比例就不快取，避免一個大回應擠掉全部
+MAX_ENTRY_FRACTION = 0.25
+
+
+def cache_key(url, params=None):
+    """URL + 排序後的查詢參數"""
+    if not params:
+        return url
+    return f"{url}?{urlencode(sorted((k, str(v)) for k, v in params.items()))}"
+
+
+class HttpCache:
+    """以位元組數為上限的 LRU 快取（thread-safe）"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (etag, last_modified, body)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def conditional_headers(self, key):
+        """
+        取得條件式請求標頭
+
+        Returns:
+            {'If-None-Match': ..., 'If-Modified-Since': ...}，沒有快取時為空 dict
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if not entry:
+            return {}
+
+        etag, last_modified, _ = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def get_body(self, key):
+        """收到 304 時取出快取內容（同時記一次命中）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def store(self, key, response):
+        """200 回應有 ETag / Last-Modified 時存起來（同時記一次未命中）"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        body = response.content
+
+        with self._lock:
+            self.misses += 1
+            if not etag and not last_modified:
+                return
+            if len(body) > self.max_bytes * MAX_ENTRY_FRACTION:
+                return
+
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= len(old[2])
+
+            self._entries[key] = (etag, last_modified, body)
+            self._size += len(body)
+
+            while self._size > self.max_bytes and self._entries:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """命中 / 未命中次數與目前容量"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# 整個 process 共用的快取（app.py 每個請求都會建立新的 ShopifyClient）
+shared_http_cache = HttpCache()
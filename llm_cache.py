@@ -0,0 +1,133 @@
+"""
+AI 文案快取
+同一個商品（同一個 updated_at）、同一種貼文類型、同一份 prompt 產生的文案存在 SQLite，
+重發或重試時直接用，不必再等幾秒的 API；商品改過、prompt 改過就自動產生新的
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key           TEXT PRIMARY KEY,
+    product_id    INTEGER,
+    post_type     TEXT NOT NULL,
+    text          TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    last_used_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used_at);
+"""
+
+
+def template_hash(*parts):
+    """prompt 範本（含模型、system、prompt 全文）的雜湊，範本一改就對不到舊的快取"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def response_key(product, post_type, prompt_hash):
+    """
+    快取鍵：商品 ID + updated_at + 貼文類型 + prompt 雜湊
+
+    Args:
+        product: 商品資料
+        post_type: 'opinion' / 'wishlist'
+        prompt_hash: template_hash() 的結果
+    """
+    return f"{product.get('id')}:{product.get('updated_at') or ''}:{post_type}:{prompt_hash}"
+
+
+class LLMCache:
+    """SQLite 文案快取（TTL + LRU，同一個檔案可被多個 process / thread 共用）"""
+
+    def __init__(self, db_path, ttl=None, max_entries=None):
+        """
+        Args:
+            db_path: SQLite 檔案路徑
+            ttl: 文案保留秒數（None = Config.LLM_CACHE_TTL）
+            max_entries: 最多保留幾筆（None = Config.LLM_CACHE_MAX_ENTRIES）
+        """
+        self.db_path = db_path
+        self.ttl = Config.LLM_CACHE_TTL if ttl is None else ttl
+        self.max_entries = Config.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # 快取掉了只是重新產生，不必每次寫入都等 fsync
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def get(self, key):
+        """
+        取得快取的文案
+
+        Returns:
+            文案，沒有或已過期時回傳 None
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT text, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row['created_at'] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_used_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return row['text']
+
+    def put(self, key, text, product_id=None, post_type=''):
+        """存入文案，並淘汰過期與超過上限的項目"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, product_id, post_type, text, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, product_id, post_type, text, now, now),
+            )
+            self._conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,))
+            self._conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                '  SELECT key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) AS n FROM responses').fetchone()['n']
+            return {'hits': self.hits, 'misses': self.misses, 'size': size, 'max_entries': self.max_entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(db_path=None):
+    """取得共用的文案快取（同一個檔案在同一個 process 內只開一次）"""
+    key = os.path.abspath(db_path or Config.LLM_CACHE_PATH)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = LLMCache(key)
+        return cache
@@ -0,0 +1,214 @@
+"""
+本機發文記錄
+記錄每個商品在哪個平台、什麼時候發過文（含貼文 ID 與輪次），
+選品時用主鍵索引查詢「最近發過沒有」，不必在 Shopify 上加標籤；
+重置輪次只是把輪次編號加一，不需要改任何商品
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id  INTEGER NOT NULL,
+    category    TEXT NOT NULL,
+    round       INTEGER NOT NULL,
+    platform    TEXT NOT NULL,
+    success     INTEGER NOT NULL,
+    post_id     TEXT,
+    posted_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_product ON posts (product_id, posted_at);
+CREATE INDEX IF NOT EXISTS idx_posts_round ON posts (category, round, product_id);
+
+CREATE TABLE IF NOT EXISTS rounds (
+    category    TEXT PRIMARY KEY,
+    round       INTEGER NOT NULL,
+    started_at  REAL NOT NULL
+);
+"""
+
+# IN (...) 一次最多放幾個參數（SQLite 預設上限 999）
+_MAX_SQL_PARAMS = 900
+
+
+class PostHistoryStore:
+    """SQLite 發文記錄（同一個檔案可被多個 process / thread 共用）"""
+
+    def __init__(self, db_path):
+        """
+        初始化發文記錄
+
+        Args:
+            db_path: SQLite 檔案路徑
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    # ------------------------------------------------------------
+    # 輪次
+    # ------------------------------------------------------------
+
+    def current_round(self, category):
+        """目前的輪次（從未發過文時為 1）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT round FROM rounds WHERE category = ?', (category,)
+            ).fetchone()
+        return row['round'] if row else 1
+
+    def reset_round(self, category):
+        """
+        開始新的一輪（只更新輪次編號，舊的發文記錄保留）
+
+        Returns:
+            新的輪次
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT round FROM rounds WHERE category = ?', (category,)
+            ).fetchone()
+            new_round = (row['round'] if row else 1) + 1
+            self._conn.execute(
+                'INSERT OR REPLACE INTO rounds (category, round, started_at) VALUES (?, ?, ?)',
+                (category, new_round, time.time()),
+            )
+        return new_round
+
+    # ------------------------------------------------------------
+    # 寫入
+    # ------------------------------------------------------------
+
+    def record_post(self, product_id, category, results):
+        """
+        記錄一次發文
+
+        Args:
+            product_id: 商品 ID
+            category: 類別（souvenir / fashion）
+            results: post_to_platforms() 的結果 {platform: {'success', 'post_id', ...}}
+
+        Returns:
+            寫入的筆數
+        """
+        now = time.time()
+        product_id = int(product_id)
+        round_ = self.current_round(category)
+        rows = [
+            (product_id, category, round_, platform, 1 if result.get('success') else 0,
+             str(result['post_id']) if result.get('post_id') else None, now)
+            for platform, result in (results or {}).items()
+        ]
+        if not rows:
+            return 0
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO posts (product_id, category, round, platform, success, post_id, posted_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+        return len(rows)
+
+    # ------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------
+
+    def last_posted_at(self, product_id):
+        """商品最後一次成功發文的時間（time.time()），沒發過時回傳 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT MAX(posted_at) AS t FROM posts WHERE product_id = ? AND success = 1',
+                (int(product_id),),
+            ).fetchone()
+        return row['t']
+
+    def posted_recently(self, product_id, within):
+        """商品是否在 within 秒內成功發過文"""
+        last = self.last_posted_at(product_id)
+        return last is not None and time.time() - last < within
+
+    def round_posts(self, category, product_ids=None):
+        """
+        本輪成功發過文的商品與最後發文時間
+
+        Args:
+            category: 類別
+            product_ids: 只查這些商品（None = 全部）
+
+        Returns:
+            {product_id: 最後發文時間}
+        """
+        round_ = self.current_round(category)
+        sql = ('SELECT product_id, MAX(posted_at) AS t FROM posts '
+               'WHERE category = ? AND round = ? AND success = 1')
+
+        if product_ids is None:
+            with self._lock:
+                rows = self._conn.execute(sql + ' GROUP BY product_id', (category, round_)).fetchall()
+            return {row['product_id']: row['t'] for row in rows}
+
+        ids = [int(pid) for pid in product_ids]
+        posted = {}
+        for start in range(0, len(ids), _MAX_SQL_PARAMS):
+            chunk = ids[start:start + _MAX_SQL_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    sql + f' AND product_id IN ({placeholders}) GROUP BY product_id',
+                    (category, round_, *chunk),
+                ).fetchall()
+            posted.update((row['product_id'], row['t']) for row in rows)
+        return posted
+
+    def round_stats(self, category):
+        """
+        本輪統計
+
+        Returns:
+            {'round', 'posted_this_round', 'round_started_at'}
+        """
+        round_ = self.current_round(category)
+        with self._lock:
+            posted = self._conn.execute(
+                'SELECT COUNT(DISTINCT product_id) AS n FROM posts '
+                'WHERE category = ? AND round = ? AND success = 1',
+                (category, round_),
+            ).fetchone()['n']
+            row = self._conn.execute(
+                'SELECT started_at FROM rounds WHERE category = ?', (category,)
+            ).fetchone()
+        return {
+            'round': round_,
+            'posted_this_round': posted,
+            'round_started_at': row['started_at'] if row else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_post_history(db_path):
+    """取得共用的發文記錄（同一個檔案在同一個 process 內只開一次）"""
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = PostHistoryStore(db_path)
+        return store
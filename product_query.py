@@ -0,0 +1,124 @@
+"""
+商品查詢條件
+同一組條件可以轉成 GraphQL 搜尋語法或 products.json 的查詢參數，
+讓 Shopify 先把不要的商品排除；Shopify 無法表達的條件才在本機過濾
+"""
+
+from datetime import datetime
+
+from tag_index import product_tags
+
+
+def _iso(value):
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    return value
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def _quote(value):
+    """GraphQL 搜尋語法的值（含特殊字元的標籤要加引號，例如 18+）"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class ProductQuery:
+    """商品篩選條件（不含系列，系列由呼叫端另外指定）"""
+
+    def __init__(self, exclude_tags=(), status=None, published=None,
+                 created_at_min=None, created_at_max=None, updated_at_min=None):
+        """
+        Args:
+            exclude_tags: 有這些標籤的商品不要（不分大小寫）
+            status: 'active' / 'draft' / 'archived'（None = 不限）
+            published: True = 只要已發布到線上商店，False = 只要未發布（None = 不限）
+            created_at_min: 上架時間下限（ISO 字串或 datetime）
+            created_at_max: 上架時間上限
+            updated_at_min: 更新時間下限
+        """
+        self.exclude_tags = frozenset(t.strip().lower() for t in exclude_tags if t.strip())
+        self.status = status
+        self.published = published
+        self.created_at_min = _iso(created_at_min)
+        self.created_at_max = _iso(created_at_max)
+        self.updated_at_min = _iso(updated_at_min)
+
+    def __repr__(self):
+        return f"ProductQuery({self.search_string()!r})"
+
+    def search_string(self, collection_id=None):
+        """
+        GraphQL products(query:) 的搜尋語法
+        例如 collection_id:123 -tag:"adult" status:active published_status:published
+
+        Args:
+            collection_id: 同時限定系列（選填）
+        """
+        parts = []
+        if collection_id is not None:
+            parts.append(f"collection_id:{int(collection_id)}")
+        parts.extend(f"-tag:{_quote(tag)}" for tag in sorted(self.exclude_tags))
+        if self.status:
+            parts.append(f"status:{self.status}")
+        if self.published is not None:
+            parts.append(f"published_status:{'published' if self.published else 'unpublished'}")
+        if self.created_at_min:
+            parts.append(f"created_at:>={_quote(self.created_at_min)}")
+        if self.created_at_max:
+            parts.append(f"created_at:<={_quote(self.created_at_max)}")
+        if self.updated_at_min:
+            parts.append(f"updated_at:>={_quote(self.updated_at_min)}")
+        return ' '.join(parts)
+
+    def rest_params(self):
+        """products.json 能直接處理的條件（排除標籤不支援，見 needs_local_filter）"""
+        params = {}
+        if self.status:
+            params['status'] = self.status
+        if self.published is not None:
+            params['published_status'] = 'published' if self.published else 'unpublished'
+        if self.created_at_min:
+            params['created_at_min'] = self.created_at_min
+        if self.created_at_max:
+            params['created_at_max'] = self.created_at_max
+        if self.updated_at_min:
+            params['updated_at_min'] = self.updated_at_min
+        return params
+
+    @property
+    def needs_local_filter(self):
+        """products.json 的結果是否還要在本機過濾"""
+        return bool(self.exclude_tags)
+
+    def matches(self, product):
+        """
+        在本機檢查商品是否符合條件（讀本機快照、或 Shopify 無法篩選時使用）
+        商品資料缺少的欄位視為符合
+        """
+        if not self.exclude_tags.isdisjoint(product_tags(product)):
+            return False
+
+        if self.status and product.get('status') and product['status'] != self.status:
+            return False
+
+        if self.published is not None and 'published_at' in product:
+            if bool(product['published_at']) != self.published:
+                return False
+
+        for key, bound, newer in (('created_at', self.created_at_min, True),
+                                  ('created_at', self.created_at_max, False),
+                                  ('updated_at', self.updated_at_min, True)):
+            if not bound or not product.get(key):
+                continue
+            value, limit = _parse_time(product[key]), _parse_time(bound)
+            if value is None or limit is None:
+                continue
+            if (value < limit) if newer else (value > limit):
+                return False
+
+        return True
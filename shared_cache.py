@@ -0,0 +1,247 @@
+"""
+跨 process 共用的 stale-while-revalidate 快取
+值存成 JSON 檔（檔案修改時間 = 更新時間），gunicorn 每個 worker 都讀同一份；
+過期時先回傳舊值，同時在背景更新，用 flock 保證所有 process 同時最多一個在更新
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows：只能保證同一個 process 內不重複更新
+    fcntl = None
+
+
+class SharedCache:
+    """一個 JSON 值的共用快取（thread-safe、多 process 共用）"""
+
+    def __init__(self, path, loader, ttl, retry_interval=60):
+        """
+        Args:
+            path: 快取檔案路徑（同一個值的所有 process 要用同一個路徑）
+            loader: loader() 回傳新的值（必須能轉成 JSON）
+            ttl: 過期秒數（過期後仍會先回傳舊值）
+            retry_interval: 背景更新失敗後，至少隔幾秒才再試
+        """
+        self.path = path
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._loader = loader
+        self._lock_path = path + '.lock'
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._value = None
+        self._mtime = None
+        self._refreshing = False
+        self._refresh_seconds = None
+        self._refresh_count = 0
+        self._last_error = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def set_loader(self, loader):
+        """換成較新的 loader（例如換了 client）"""
+        self._loader = loader
+
+    # ------------------------------------------------------------
+    # 檔案
+    # ------------------------------------------------------------
+
+    def _read_disk(self):
+        """檔案有更新時重新讀取（其他 worker 寫入的也看得到），回傳 mtime"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            if mtime == self._mtime:
+                return mtime
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._value = value
+            self._mtime = mtime
+        return mtime
+
+    def _write_disk(self, value):
+        """先寫暫存檔再 rename，其他 process 不會讀到寫一半的檔案"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cache-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return os.stat(self.path).st_mtime
+
+    def _age(self, mtime):
+        # invalidate() 把 mtime 設成 0，要當成「很舊」而不是「沒有資料」
+        return time.time() - mtime if mtime is not None else None
+
+    # ------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------
+
+    def _refresh_locked(self, blocking):
+        """
+        拿到跨 process 的鎖後重新載入
+
+        Args:
+            blocking: False = 其他 process 正在更新時直接放棄
+
+        Returns:
+            True = 有更新（或其他 process 剛更新完），False = 沒拿到鎖
+        """
+        with self._load_lock:
+            lock_file = open(self._lock_path, 'a')
+            try:
+                if fcntl is not None:
+                    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                    try:
+                        fcntl.flock(lock_file, flags)
+                    except BlockingIOError:
+                        return False
+
+                # 等鎖的期間其他 worker 可能已經更新好了
+                age = self._age(self._read_disk())
+                if age is not None and age <= self.ttl:
+                    return True
+
+                started = time.monotonic()
+                try:
+                    value = self._loader()
+                except Exception as e:
+                    with self._lock:
+                        self._last_error = str(e)
+                    raise
+
+                mtime = self._write_disk(value)
+                with self._lock:
+                    self._value = value
+                    self._mtime = mtime
+                    self._refresh_seconds = time.monotonic() - started
+                    self._refresh_count += 1
+                    self._last_error = None
+                    self._failed_at = None
+                return True
+            finally:
+                lock_file.close()
+
+    def refresh(self):
+        """同步重新載入（其他 process 正在更新時等它完成）"""
+        self._refresh_locked(blocking=True)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            # 剛失敗過就先不要再試（來源掛掉時不必每次讀取都打一次）
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_interval:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._refresh_locked(blocking=False)
+            except Exception as e:
+                with self._lock:
+                    self._failed_at = time.monotonic()
+                print(f"[SharedCache] 背景更新失敗，繼續使用舊的值（{os.path.basename(self.path)}）: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+    # ------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------
+
+    def get(self):
+        """
+        取得目前的值
+        完全沒有資料時同步載入；過期時先回傳舊值，同時在背景更新
+
+        Raises:
+            第一次載入失敗時丟出 loader 的例外
+        """
+        mtime = self._read_disk()
+        if mtime is None:
+            self.refresh()
+        elif self._age(mtime) > self.ttl:
+            self._refresh_in_background()
+
+        with self._lock:
+            return self._value
+
+    def peek(self):
+        """
+        不等待的讀取：回傳目前的值（還沒有資料時回傳 None）
+        沒有資料或過期時在背景更新
+        """
+        mtime = self._read_disk()
+        if mtime is None or self._age(mtime) > self.ttl:
+            self._refresh_in_background()
+
+        with self._lock:
+            return self._value
+
+    def invalidate(self):
+        """標記為過期（所有 process 下次讀取時在背景更新）"""
+        try:
+            os.utime(self.path, (0, 0))
+        except FileNotFoundError:
+            pass
+
+    def status(self):
+        """快取的新鮮度與更新耗時"""
+        try:
+            age = self._age(os.stat(self.path).st_mtime)
+        except FileNotFoundError:
+            age = None
+        with self._lock:
+            return {
+                'age_seconds': round(age, 1) if age is not None else None,
+                'ttl_seconds': self.ttl,
+                'stale': age is None or age > self.ttl,
+                'refreshing': self._refreshing,
+                'last_refresh_seconds': round(self._refresh_seconds, 3) if self._refresh_seconds is not None else None,
+                'refresh_count': self._refresh_count,
+                'last_error': self._last_error,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_shared_cache(path, loader, ttl):
+    """
+    取得共用的快取（同一個檔案在同一個 process 內只有一個）
+
+    Args:
+        path: 快取檔案路徑
+        loader: loader() 回傳新的值
+        ttl: 過期秒數
+    """
+    key = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = SharedCache(path, loader, ttl)
+        else:
+            cache.set_loader(loader)
+        return cache
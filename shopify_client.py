@@ -5,21 +5,334 @@ Shopify API 客戶端
 
 import requests
 from urllib.parse import urljoin, quote
+import asyncio
+import heapq
 import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from catalog_store import ALL_PRODUCTS_SCOPE, catalog_scope
+from tag_index import product_tags
+import shopify_graphql as gql
+from shopify_rate_limit import get_bucket, parse_retry_after
+from collection_index import get_collection_index
+from http_cache import shared_http_cache, cache_key
+from shopify_retry import (
+    ShopifyError, ShopifyClientError, ShopifyConnectionError, ShopifyGraphQLError,
+    ShopifyNotFoundError, ShopifyThrottledError, ShopifyTimeoutError,
+    DEFAULT_RETRY_POLICY, error_for_status, raise_for_status, retry_stats,
+)
+
+# 本機快照超過這個秒數沒有完整同步，就重新完整抓一次
+# （updated_at_min 的增量同步抓不到「被移出系列」的商品）
+CATALOG_FULL_SYNC_INTERVAL = 6 * 60 * 60
+
+# 平行抓取完整目錄時切成幾個 created_at 時間區段，以及同時跑幾條連線
+# （Shopify REST 每個商店的 bucket 是 40 次、每秒回復 2 次，同時 4 條不會很快耗盡）
+PARALLEL_FETCH_PARTITIONS = 8
+PARALLEL_FETCH_WORKERS = 4
+
+# 商品是否在系列中的查詢結果要快取多久
+# 不在系列中的結果只留短時間：smart collection 的規則套用會有延遲
+MEMBERSHIP_CACHE_TTL = 10 * 60
+MEMBERSHIP_NEGATIVE_CACHE_TTL = 60
+
+_membership_cache = {}  # {(store_url, collection_id, product_id): (is_member, timestamp)}
+_membership_lock = threading.Lock()
+
+# smart collection 規則會用到的欄位：這些欄位沒變，商品就不會進出系列
+# （規則也可以用款式的價格、原價、庫存、重量、名稱，例如特價或有庫存的系列）
+MEMBERSHIP_FIELDS = ('tags', 'product_type', 'vendor', 'title')
+MEMBERSHIP_VARIANT_FIELDS = ('title', 'price', 'compare_at_price', 'inventory_quantity', 'weight')
+
+# 批次修改標籤時，一個 GraphQL mutation 最多放幾個 tagsAdd / tagsRemove
+# （每個約 10 點成本，25 個約 250 點，遠低於單次查詢 1000 點上限）
+TAG_MUTATIONS_PER_REQUEST = 25
+
+# nodes(ids:) 一次最多查幾個商品
+TAG_QUERY_CHUNK_SIZE = 250
+
+# products.json?ids= 一次最多查幾個商品（等於每頁上限）
+PRODUCT_IDS_CHUNK_SIZE = 250
+
+# 最新商品的 GraphQL 查詢每頁幾個商品
+# （每個商品含 images(first: 10)、variants(first: 1) 約 16 點，50 個約 800 點，
+#  不會超過單次查詢 1000 點上限；更多時用 after 游標翻頁）
+NEWEST_QUERY_PAGE_SIZE = 50
+
+# products.json 的欄位組合（fields= 參數），呼叫端依用途明確指定
+#   selector: 選品只需要的欄位（不含 body_html、options）
+#   render:   產生貼文需要的欄位
+#   full:     全部欄位
+# （status、published_at 讓 ProductQuery 能在本機快照上過濾）
+PRODUCT_FIELD_PROFILES = {
+    'selector': 'id,title,handle,created_at,updated_at,published_at,status,tags,images,variants',
+    'render': 'id,title,handle,created_at,updated_at,published_at,status,tags,images,variants,'
+              'body_html,product_type,vendor',
+    'full': None,
+}
+
+# 本機快照一律用同一組欄位，讓選品和產生貼文都能直接讀快照
+CATALOG_FIELD_PROFILE = 'render'
+
+
+def forget_membership(store_url, product_id=None, collection_id=None):
+    """清掉系列成員資格的快取（不指定 = 該商店全部）"""
+    store_url = store_url.rstrip('/')
+    with _membership_lock:
+        for key in list(_membership_cache):
+            url, cid, pid = key
+            if url != store_url:
+                continue
+            if product_id is not None and pid != int(product_id):
+                continue
+            if collection_id is not None and cid != int(collection_id):
+                continue
+            del _membership_cache[key]
+
+
+def catalog_product(product):
+    """只保留快照需要的欄位（Webhook payload 比 products.json?fields= 多很多欄位）"""
+    fields = PRODUCT_FIELD_PROFILES[CATALOG_FIELD_PROFILE].split(',')
+    return {k: product[k] for k in fields if k in product}
+
+
+def product_fields_params(profile):
+    """
+    欄位組合名稱 → products.json 的查詢參數
+
+    Args:
+        profile: 'selector' / 'render' / 'full'
+
+    Returns:
+        {'fields': ...}，full 時為空 dict
+    """
+    if profile not in PRODUCT_FIELD_PROFILES:
+        raise ValueError(f"未知的欄位組合: {profile}（可用：{', '.join(PRODUCT_FIELD_PROFILES)}）")
+    fields = PRODUCT_FIELD_PROFILES[profile]
+    return {'fields': fields} if fields else {}
+
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def created_at_key(product):
+    """
+    依上架時間排序用的鍵（轉成 UTC 的 datetime）
+    REST 的 created_at 帶商店時區（+09:00），GraphQL 的 createdAt 是 UTC（Z），不能直接比字串
+
+    Returns:
+        datetime，沒有或格式不符時為最舊
+    """
+    value = product.get('created_at')
+    if not value:
+        return _EPOCH
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return _EPOCH
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def order_by_ids(ids, products):
+    """
+    依輸入的 ID 順序排列商品
+
+    Returns:
+        (products, missing_ids)
+    """
+    found = {p['id']: p for p in products if p.get('id') is not None}
+    return [found[pid] for pid in ids if pid in found], [pid for pid in ids if pid not in found]
+
+
+def plan_tag_mutations(operations):
+    """
+    把標籤操作切成一批批的 GraphQL mutation
+
+    Args:
+        operations: [{'product_id': 123, 'add': [...], 'remove': [...]}, ...]
+
+    Returns:
+        (results, batches)
+        results: {product_id: {'success': True, 'error': None}}（預設成功，失敗時再改）
+        batches: [(chunk, mutation, variables), ...]，chunk 為 [(product_id, mutation_name, tags)]
+    """
+    results = {}
+    mutations = []
+
+    for op in operations:
+        product_id = int(op['product_id'])
+        results[product_id] = {'success': True, 'error': None}
+        if op.get('add'):
+            mutations.append((product_id, 'tagsAdd', op['add']))
+        if op.get('remove'):
+            mutations.append((product_id, 'tagsRemove', op['remove']))
+
+    batches = []
+    for start in range(0, len(mutations), TAG_MUTATIONS_PER_REQUEST):
+        chunk = mutations[start:start + TAG_MUTATIONS_PER_REQUEST]
+        mutation, variables = gql.tags_mutation(
+            [(name, gql.to_gid('Product', pid), tags) for pid, name, tags in chunk]
+        )
+        batches.append((chunk, mutation, variables))
+
+    return results, batches
+
+
+def collect_tag_results(results, chunk, data, failure=None):
+    """把一批 mutation 的回應寫回 results（整批請求失敗時傳入 failure）"""
+    for i, (product_id, name, _) in enumerate(chunk):
+        payload = (data or {}).get(f't{i}')
+        if failure is not None:
+            error = f'GraphQL 請求失敗: {failure}'
+        elif data is None:
+            error = 'GraphQL 請求失敗'
+        elif not payload:
+            error = f'{name} 沒有回應'
+        elif payload.get('userErrors'):
+            error = '; '.join(e.get('message', '') for e in payload['userErrors'])
+        else:
+            continue
+        results[product_id] = {'success': False, 'error': error}
+
+
+def report_tag_results(results):
+    failed = sum(1 for r in results.values() if not r['success'])
+    if failed:
+        print(f"[Tags] ⚠️  {failed}/{len(results)} 個商品標籤更新失敗")
+
+
+def plan_prefix_removal(product_ids, current_tags, prefix):
+    """
+    依目前標籤算出要移除哪些符合前綴的標籤
+
+    Returns:
+        (results, operations)：results 只包含找不到的商品
+    """
+    results = {}
+    operations = []
+    for pid in product_ids:
+        if pid not in current_tags:
+            results[pid] = {'success': False, 'error': '找不到商品'}
+            continue
+        matched = [t for t in current_tags[pid] if t.startswith(prefix)]
+        operations.append({'product_id': pid, 'remove': matched})
+    return results, operations
+
+
+def graphql_error(result):
+    """
+    檢查 GraphQL 回應中的 errors
+
+    Returns:
+        全部都是 THROTTLED 時回傳 ShopifyThrottledError，其他錯誤回傳 ShopifyGraphQLError，
+        沒有錯誤時回傳 None
+    """
+    errors = result.get('errors') or []
+    if not errors:
+        return None
+    if all(e.get('extensions', {}).get('code') == 'THROTTLED' for e in errors):
+        return ShopifyThrottledError('GraphQL 額度不足（THROTTLED）')
+    return ShopifyGraphQLError(f"GraphQL 錯誤: {errors}")
+
+
+def graphql_throttle_wait(result, default):
+    """從 GraphQL 回應的 extensions.cost 算出需要等待的秒數"""
+    cost = (result.get('extensions') or {}).get('cost') or {}
+    status = cost.get('throttleStatus') or {}
+    try:
+        missing = cost['requestedQueryCost'] - status['currentlyAvailable']
+        return max(0.5, missing / status['restoreRate'])
+    except (KeyError, TypeError, ZeroDivisionError):
+        return default
+
+
+# 系列名稱 → handle 對照表（Config 裡的系列名稱不一定等於 Shopify 上的標題）
+COLLECTION_NAME_TO_HANDLE = {
+    '小倉山莊': '小倉山莊',
+    'YOKUMOKU': 'yokumoku',
+    '砂糖奶油樹': '砂糖奶油樹',
+    '坂角總本舖': '坂角總本舖',
+    '神戶風月堂': '神戶風月堂',
+    '銀座菊廼舍': '銀座菊廼舍',
+    '資生堂PARLOUR': '資生堂parlour',
+    '虎屋羊羹': '虎屋羊羹',
+    'FRANCAIS': 'francais',
+    'COCORIS': 'cocoris',
+    'Gateau Festa Harada': 'gateau-festa-harada',
+    'The maple mania 楓糖男孩': 'the-maple-mania-楓糖男孩',
+    'Human Made': 'human-made-1',
+    'X-girl': 'x-girl',
+    "BAPE Men's": 'bape',
+    "BAPE Women's": 'bape',
+    "BAPE kids": 'bape',
+    'work man 作業服': 'workman-作業服',
+    'work man 男裝': 'workman-男裝',
+    'work man 女裝': 'workman-女裝',
+    'work man 兒童': 'workman-兒童',
+    'adidas 男鞋': 'adidas-男鞋',
+    'adidas 女鞋': 'adidas-女鞋',
+}
+
+# 忽略大小寫的對照表（只建一次）
+_COLLECTION_NAME_TO_HANDLE_LOWER = {k.lower(): v for k, v in COLLECTION_NAME_TO_HANDLE.items()}
+
+
+def iter_json_array(text, key):
+    """
+    從 {"key": [ ... ]} 格式的 JSON 字串中逐個解析陣列元素
+    一次只產生一個 dict，不需要先把整頁轉成 Python 物件
+
+    Args:
+        text: JSON 字串
+        key: 陣列所在的欄位名稱
+
+    Yields:
+        陣列中的每個元素
+    """
+    decoder = json.JSONDecoder()
+    start = text.find(f'"{key}"')
+    if start < 0:
+        return
+    pos = text.find('[', start) + 1
+    if pos <= 0:
+        return
+
+    length = len(text)
+    while pos < length:
+        while pos < length and text[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= length or text[pos] == ']':
+            return
+        item, pos = decoder.raw_decode(text, pos)
+        yield item
+
 
 class ShopifyClient:
     """Shopify API 客戶端"""
 
-    def __init__(self, store_url, access_token=None):
+    def __init__(self, store_url, access_token=None, catalog=None, http_cache=shared_http_cache,
+                 retry_policy=DEFAULT_RETRY_POLICY):
         """
         初始化客戶端
 
         Args:
             store_url: 商店網址 (例如 https://goyoutati.com)
             access_token: Shopify Admin API access token (選填，用於存取完整資料)
+            catalog: CatalogStore 本機商品快照（選填）
+            http_cache: GET 回應的條件式請求快取（None = 不快取）
+            retry_policy: 重試次數、退避時間與操作期限
         """
         self.store_url = store_url.rstrip('/')
         self.access_token = access_token
+        self.catalog = catalog
+        self.http_cache = http_cache
+        self.retry_policy = retry_policy
         self.session = requests.Session()
 
         if access_token:
@@ -29,8 +342,62 @@ class ShopifyClient:
                 'Content-Type': 'application/json'
             })
 
-    def _make_request(self, endpoint, params=None):
-        """發送 API 請求"""
+    def async_client(self):
+        """建立設定相同的 AsyncShopifyClient（需要 httpx）"""
+        from async_shopify_client import AsyncShopifyClient
+        return AsyncShopifyClient(self.store_url, self.access_token, retry_policy=self.retry_policy)
+
+    def run_async(self, func):
+        """
+        在新的 event loop 裡執行 func(async_client)，讓同步的呼叫端
+        （cli.py、scheduler.py、Flask 的背景 thread）也能一次送出多個平行請求
+
+        Args:
+            func: 接收 AsyncShopifyClient 的 async 函式
+
+        Returns:
+            func 的回傳值
+        """
+        async def runner():
+            async with self.async_client() as client:
+                return await func(client)
+
+        return asyncio.run(runner())
+
+    def get_products_by_collection_ids(self, collection_ids, fields='full'):
+        """
+        同時抓取多個系列的商品（交給 AsyncShopifyClient 平行處理）
+
+        Args:
+            collection_ids: 系列 ID 列表
+            fields: 欄位組合
+
+        Returns:
+            {collection_id: 商品列表}
+        """
+        ids = [int(cid) for cid in collection_ids]
+
+        async def fetch(client):
+            pages = await asyncio.gather(*(
+                client.get_products_by_collection_id(cid, fields=fields) for cid in ids
+            ))
+            return dict(zip(ids, pages))
+
+        return self.run_async(fetch)
+
+    def _make_request(self, endpoint, params=None, decode=True, deadline=None):
+        """
+        發送 API 請求
+
+        Args:
+            endpoint: API 路徑
+            params: 查詢參數
+            decode: False 時回傳原始 JSON 字串，由呼叫端自行逐步解析
+            deadline: 所屬操作的期限（time.monotonic() 時間，None = 從現在起算）
+
+        Raises:
+            ShopifyError: 重試後仍失敗（404 為 ShopifyNotFoundError）
+        """
         if self.access_token:
             # Admin API (需要 access token)
             url = f"{self.store_url}/admin/api/2024-10/{endpoint}"
@@ -38,53 +405,447 @@ class ShopifyClient:
             # Storefront API (公開)
             url = f"{self.store_url}/{endpoint}"
 
+        key = cache_key(url, params)
+        headers = self.http_cache.conditional_headers(key) if self.http_cache else {}
+
+        response = self._send('GET', url, deadline=deadline, params=params, headers=headers)
+
+        if response.status_code == 304 and self.http_cache:
+            body = self.http_cache.get_body(key)
+            if body is not None:
+                return json.loads(body) if decode else body.decode('utf-8')
+            # 快取剛好被淘汰：不帶條件標頭重抓一次
+            response = self._send('GET', url, deadline=deadline, params=params)
+
+        raise_for_status(response)
         try:
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"API 請求失敗: {e}")
+            data = response.json() if decode else response.text
+        except ValueError as e:
+            raise ShopifyError(f"回應不是有效的 JSON: {e}", response.status_code) from e
+        if self.http_cache:
+            self.http_cache.store(key, response)
+        return data
+
+    def _send(self, method, url, deadline=None, **kwargs):
+        """
+        經過呼叫額度控制發送請求
+        連線失敗、逾時、429、5xx 依 jitter 指數退避重試（429 優先用 Retry-After）
+
+        Args:
+            method: HTTP 方法
+            url: 完整網址
+            deadline: 所屬操作的期限（time.monotonic() 時間，None = 從現在起算）
+
+        Returns:
+            Response（狀態碼 < 500 且不是 429）
+
+        Raises:
+            ShopifyError: 重試次數用完或超過期限
+        """
+        policy = self.retry_policy
+        if deadline is None:
+            deadline = policy.new_deadline()
+        bucket = get_bucket(self.store_url) if self.access_token else None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if bucket:
+                retry_stats.record_wait(bucket.acquire())
+
+            retry_stats.record_request()
+            response = None
+            try:
+                response = self.session.request(method, url, timeout=policy.timeout_for(deadline), **kwargs)
+            except requests.exceptions.Timeout as e:
+                error = ShopifyTimeoutError(f"請求逾時: {e}")
+            except requests.exceptions.ConnectionError as e:
+                error = ShopifyConnectionError(f"連線失敗: {e}")
+            except requests.exceptions.RequestException as e:
+                retry_stats.record_failure()
+                raise ShopifyError(f"API 請求失敗: {e}") from e
+            else:
+                if bucket:
+                    bucket.update(response.headers)
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                error = error_for_status(response.status_code, f"HTTP {response.status_code} ({method} {url})")
+
+            retry_after = None
+            if isinstance(error, ShopifyThrottledError):
+                retry_after = parse_retry_after(response.headers, default=None)
+            delay = policy.next_delay(error, attempt, deadline, retry_after)
+
+            if bucket and isinstance(error, ShopifyThrottledError):
+                # 讓同一個商店的其他 thread 也一起暫停，等待時間由 acquire() 記錄
+                bucket.block_for(delay)
+            else:
+                retry_stats.record_wait(delay, throttled=isinstance(error, ShopifyThrottledError))
+                time.sleep(delay)
+
+    def _graphql_request(self, query, variables=None, deadline=None):
+        """
+        發送 GraphQL Admin API 請求
+
+        Returns:
+            回應中的 data，沒有 Admin API Token 時回傳 None
+
+        Raises:
+            ShopifyGraphQLError: 回應中有 errors
+            ShopifyError: 重試後仍失敗
+        """
+        if not self.access_token:
+            print("需要 Admin API Token 才能使用 GraphQL")
             return None
 
-    def get_all_products(self, limit=250):
+        policy = self.retry_policy
+        if deadline is None:
+            deadline = policy.new_deadline()
+        url = f"{self.store_url}/admin/api/2024-10/graphql.json"
+        payload = {'query': query, 'variables': variables or {}}
+
+        attempt = 0
+        while True:
+            attempt += 1
+            response = self._send('POST', url, deadline=deadline, json=payload)
+            raise_for_status(response)
+            try:
+                result = response.json()
+            except ValueError as e:
+                raise ShopifyError(f"GraphQL 回應不是有效的 JSON: {e}", response.status_code) from e
+
+            error = graphql_error(result)
+            if error is None:
+                return result.get('data')
+
+            # GraphQL 是以查詢成本計算額度，依回復速度算出要等多久
+            retry_after = graphql_throttle_wait(result, default=None) if error.retryable else None
+            delay = policy.next_delay(error, attempt, deadline, retry_after)
+            retry_stats.record_wait(delay)
+            time.sleep(delay)
+
+    def run_bulk_query(self, query, poll_interval=5, timeout=1800):
         """
-        取得所有商品
+        啟動 bulkOperationRunQuery 並等它跑完
 
         Args:
-            limit: 每頁商品數量 (最大 250)
+            query: bulk 查詢（不含 first 參數）
+            poll_interval: 查詢進度的間隔秒數
+            timeout: 最多等多久
 
         Returns:
-            商品列表
+            結果 JSONL 的下載網址（沒有任何資料時為 ''），
+            啟動失敗或 bulk operation 沒有完成時回傳 None
+
+        Raises:
+            ShopifyError: 啟動或查詢進度的請求失敗
         """
-        endpoint = 'products.json'
-        params = {'limit': limit}
+        data = self._graphql_request(gql.BULK_RUN_MUTATION, {'query': query})
+        if not data:
+            return None
 
-        all_products = []
+        run = data['bulkOperationRunQuery']
+        if run.get('userErrors'):
+            print(f"Bulk operation 啟動失敗: {run['userErrors']}")
+            return None
 
-        while True:
-            data = self._make_request(endpoint, params)
-            if not data or 'products' not in data:
-                break
+        operation_id = run['bulkOperation']['id']
+        deadline = time.time() + timeout
+
+        while time.time() < deadline:
+            status_data = self._graphql_request(gql.BULK_STATUS_QUERY, {'id': operation_id})
+            operation = (status_data or {}).get('node') or {}
+            status = operation.get('status')
+
+            if status in gql.BULK_FINISHED_STATUSES:
+                if status != 'COMPLETED':
+                    print(f"Bulk operation 結束於 {status}: {operation.get('errorCode')}")
+                    return None
+                return operation.get('url') or ''
+
+            time.sleep(poll_interval)
+
+        print(f"Bulk operation 逾時（{timeout} 秒）: {operation_id}")
+        return None
+
+    def iter_bulk_products(self, url):
+        """
+        串流下載 bulk operation 的 JSONL 結果，一次 yield 一個商品
 
-            products = data['products']
-            all_products.extend(products)
+        Args:
+            url: run_bulk_query() 回傳的網址
+
+        Yields:
+            REST 格式的商品 dict
+        """
+        if not url:
+            return
+
+        # 結果放在外部儲存空間，不能帶 X-Shopify-Access-Token，所以不用 self.session
+        with requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            yield from gql.parse_bulk_products(response.iter_lines())
+
+    def get_all_products_bulk(self, collection_id=None, poll_interval=5, timeout=1800):
+        """
+        用 GraphQL Bulk Operation 匯出整個目錄（或整個系列）
+        不佔用 REST 的呼叫額度，大量商品時比逐頁抓取快很多
+
+        Args:
+            collection_id: 只匯出這個系列（None = 全部商品）
+            poll_interval: 查詢進度的間隔秒數
+            timeout: 最多等多久
+
+        Returns:
+            商品列表（格式與 products.json 相同），失敗時回傳 None
+        """
+        url = self.run_bulk_query(gql.bulk_products_query(collection_id), poll_interval, timeout)
+        if url is None:
+            return None
+        return list(self.iter_bulk_products(url))
+
+    def _iter_product_pages(self, params, limit=250, deadline=None, stop=None):
+        """
+        用 since_id 翻頁抓取 products.json，每頁逐個解析商品後 yield
+        同一時間只有一頁的原始 JSON 在記憶體裡
+
+        Args:
+            params: 查詢參數（collection_id、updated_at_min 等）
+            limit: 每頁商品數量（最大 250）
+            deadline: 整個翻頁操作的期限（None = 從第一頁起算 retry_policy.operation_timeout）
+            stop: threading.Event，設定後不再送出下一頁的請求
+
+        Yields:
+            商品 dict
+
+        Raises:
+            ShopifyError: 任何一頁重試後仍失敗（不會只回傳前面幾頁）
+        """
+        params = dict(params, limit=limit)
+        if deadline is None:
+            deadline = self.retry_policy.new_deadline()
+
+        while True:
+            if stop is not None and stop.is_set():
+                return
+            body = self._make_request('products.json', params, decode=False, deadline=deadline)
+            if '"products"' not in body:
+                raise ShopifyError("products.json 回應缺少 products")
+
+            count = 0
+            last_id = None
+            for product in iter_json_array(body, 'products'):
+                count += 1
+                last_id = product.get('id')
+                yield product
+            del body
 
             # 檢查是否有下一頁
-            if len(products) < limit:
-                break
+            if count < limit or last_id is None:
+                return
 
             # 用最後一個商品的 ID 作為 since_id
-            params['since_id'] = products[-1]['id']
+            params['since_id'] = last_id
+
+    def _fetch_product_pages(self, params, limit=250):
+        """
+        用 since_id 翻頁抓取 products.json 的所有結果
+
+        Args:
+            params: 查詢參數（collection_id、updated_at_min 等）
+            limit: 每頁商品數量（最大 250）
+
+        Returns:
+            商品列表
+        """
+        return list(self._iter_product_pages(params, limit))
+
+    def _created_at_windows(self, params, partitions, deadline=None):
+        """
+        把 created_at 切成 partitions 個不重疊的時間區段
+        第一段沒有下限、最後一段沒有上限，確保不會漏掉任何商品
+
+        Returns:
+            [(created_at_min, created_at_max), ...]，無法切分時回傳 None
+        """
+        # since_id 由小到大排序，第一個商品大致就是最早上架的
+        data = self._make_request(
+            'products.json', dict(params, limit=1, fields='id,created_at'), deadline=deadline
+        )
+        if not data or not data.get('products'):
+            return None
+
+        try:
+            start = datetime.fromisoformat(data['products'][0]['created_at']).astimezone(timezone.utc)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        end = datetime.now(timezone.utc)
+        if partitions < 2 or end <= start:
+            return None
+
+        step = (end - start) / partitions
+        bounds = [(start + step * i).isoformat(timespec='seconds') for i in range(1, partitions)]
+        return list(zip([None] + bounds, bounds + [None]))
+
+    def _iter_product_pages_parallel(self, params, limit=250, partitions=PARALLEL_FETCH_PARTITIONS):
+        """
+        把 products.json 依 created_at 切段平行翻頁，抓到一頁就 yield 一頁的商品
+        各區段透過有上限的佇列交給呼叫端，記憶體只跟同時在途的頁數有關
+
+        Args:
+            params: 查詢參數
+            limit: 每頁商品數量（最大 250）
+            partitions: 時間區段數量
+
+        Yields:
+            商品 dict（不保證順序，已用 ID 去重）
+
+        Raises:
+            ShopifyError: 任何一個區段失敗（整個操作共用同一個期限）
+        """
+        deadline = self.retry_policy.new_deadline()
+        windows = self._created_at_windows(params, partitions, deadline)
+        if not windows:
+            yield from self._iter_product_pages(params, limit, deadline)
+            return
+
+        pages = queue.Queue(maxsize=PARALLEL_FETCH_WORKERS * 2)
+        stop = threading.Event()
+        window_done = object()
+
+        def put(item):
+            # 呼叫端提前結束時不要卡在 put
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch_window(window):
+            if stop.is_set():
+                # 呼叫端已經結束，還在排隊的區段不必開始
+                return
+            window_params = dict(params)
+            if window[0]:
+                window_params['created_at_min'] = window[0]
+            if window[1]:
+                window_params['created_at_max'] = window[1]
+            try:
+                page = []
+                for product in self._iter_product_pages(window_params, limit, deadline, stop):
+                    page.append(product)
+                    if len(page) >= limit:
+                        if not put(page):
+                            return
+                        page = []
+                if page:
+                    put(page)
+            except Exception as e:
+                # 交給呼叫端丟出，不能當成這個區段已經抓完
+                put(e)
+            finally:
+                put(window_done)
+
+        seen_ids = set()
+        remaining = len(windows)
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_FETCH_WORKERS, len(windows))) as pool:
+            for window in windows:
+                pool.submit(fetch_window, window)
+            try:
+                while remaining:
+                    page = pages.get()
+                    if page is window_done:
+                        remaining -= 1
+                        continue
+                    if isinstance(page, Exception):
+                        raise page
+                    # 區段邊界的時間點兩邊都包含，用 ID 去重
+                    for product in page:
+                        if product['id'] not in seen_ids:
+                            seen_ids.add(product['id'])
+                            yield product
+            finally:
+                # 呼叫端提前結束：還沒開始的區段取消，跑到一半的在下一頁請求前停止
+                stop.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_product_pages_parallel(self, params, limit=250, partitions=PARALLEL_FETCH_PARTITIONS):
+        """
+        把 products.json 依 created_at 切段，平行翻頁後合併去重
+
+        Returns:
+            商品列表（依 ID 排序，與逐頁抓取的順序相同）
+        """
+        products = list(self._iter_product_pages_parallel(params, limit, partitions))
+        products.sort(key=lambda p: p['id'])
+        return products
+
+    def iter_products(self, collection_id=None, limit=250, fields='full', parallel=False, query=None,
+                      **filters):
+        """
+        逐頁抓取商品並一個一個 yield，不把整個目錄放進記憶體
+
+        Args:
+            collection_id: 只抓這個系列（None = 全部商品）
+            limit: 每頁商品數量（最大 250）
+            fields: 欄位組合（'selector' / 'render' / 'full'）
+            parallel: 依上架時間切段平行抓取（順序不固定）
+            query: ProductQuery 篩選條件（products.json 能處理的交給 Shopify，其餘在本機過濾）
+            **filters: 其他 products.json 參數（例如 updated_at_min）
 
-        return all_products
+        Yields:
+            商品 dict
 
-    def get_products_by_collection_id(self, collection_id, limit=250):
+        Raises:
+            ShopifyError: 任何一頁重試後仍失敗
+        """
+        if collection_id is not None and not self.access_token:
+            print("需要 Admin API Token 才能用 collection_id 查詢")
+            return
+
+        params = dict(product_fields_params(fields), **filters)
+        if query is not None:
+            params.update(query.rest_params())
+        if collection_id is not None:
+            params['collection_id'] = int(collection_id)
+
+        if parallel and self.access_token:
+            products = self._iter_product_pages_parallel(params, limit)
+        else:
+            products = self._iter_product_pages(params, limit)
+
+        if query is not None and query.needs_local_filter:
+            products = filter(query.matches, products)
+        yield from products
+
+    def get_all_products(self, limit=250, parallel=False, fields='full'):
+        """
+        取得所有商品
+
+        Args:
+            limit: 每頁商品數量 (最大 250)
+            parallel: 依上架時間切段平行抓取（適合大量商品的完整重建）
+            fields: 欄位組合（'selector' / 'render' / 'full'）
+
+        Returns:
+            商品列表
+        """
+        params = product_fields_params(fields)
+        if parallel and self.access_token:
+            return self._fetch_product_pages_parallel(params, limit)
+        return self._fetch_product_pages(params, limit)
+
+    def get_products_by_collection_id(self, collection_id, limit=250, fields='full'):
         """
         用 Collection ID 直接抓取該系列的所有商品
 
         Args:
             collection_id: Shopify Collection 數字 ID
             limit: 每頁商品數量（最大 250）
+            fields: 欄位組合（'selector' / 'render' / 'full'）
 
         Returns:
             商品列表
@@ -93,26 +854,400 @@ class ShopifyClient:
             print("需要 Admin API Token 才能用 collection_id 查詢")
             return []
 
-        all_products = []
-        params = {
-            'collection_id': int(collection_id),
-            'limit': limit
+        params = dict(product_fields_params(fields), collection_id=int(collection_id))
+        return self._fetch_product_pages(params, limit)
+
+    def sync_catalog(self, collection_id=None, full=False, limit=250):
+        """
+        同步本機商品快照
+        第一次（或 full=True）完整抓取，之後只用 updated_at_min 抓有變動的商品
+
+        Args:
+            collection_id: 要同步的系列 ID（None = 全部商品）
+            full: 強制完整同步
+            limit: 每頁商品數量（最大 250）
+
+        Returns:
+            本次寫入快照的商品數量
+
+        Raises:
+            ShopifyError: 抓取失敗（快照維持原狀）
+        """
+        if not self.catalog or not self.access_token:
+            return 0
+
+        scope = catalog_scope(collection_id)
+        state = self.catalog.get_sync_state(scope)
+        params = product_fields_params(CATALOG_FIELD_PROFILE)
+        if collection_id is not None:
+            params['collection_id'] = int(collection_id)
+
+        if full or not state:
+            products = self._fetch_product_pages_parallel(params, limit)
+            if not products and state:
+                # 系列突然變成空的多半是設定或權限問題，保留舊快照，不要整個清空
+                print(f"[Catalog] ⚠️  完整同步沒有取得商品，保留舊快照（scope={scope}）")
+                return 0
+            written = self.catalog.replace_scope(scope, products)
+            last_updated_at = max((p.get('updated_at') or '' for p in products), default=None)
+            self.catalog.mark_synced(scope, last_updated_at, full=True)
+            print(f"[Catalog] 完整同步 scope={scope}：{written} 個商品")
+            return written
+
+        if state.get('last_updated_at'):
+            params['updated_at_min'] = state['last_updated_at']
+        products = self._fetch_product_pages(params, limit)
+        written = self.catalog.upsert_products(products, scope)
+        last_updated_at = max(
+            [p.get('updated_at') or '' for p in products] + [state.get('last_updated_at') or ''],
+        ) or None
+        self.catalog.mark_synced(scope, last_updated_at)
+        if written:
+            print(f"[Catalog] 增量同步 scope={scope}：{written} 個商品有變動")
+        return written
+
+    def iter_catalog_products(self, collection_id=None, max_age=300, fields='full', query=None):
+        """
+        從本機快照逐批讀取商品，快照過期時先做增量同步
+        沒有設定快照時，直接向 Shopify 逐頁抓取
+
+        Args:
+            collection_id: 系列 ID（None = 全部商品）
+            max_age: 快照可接受的最大秒數，超過就先增量同步
+            fields: 直接向 Shopify 抓取時的欄位組合
+                    （快照本身固定用 CATALOG_FIELD_PROFILE）
+            query: ProductQuery 篩選條件
+
+        Yields:
+            商品 dict（有快照時按上架時間排序，新的優先）
+        """
+        if not self.catalog:
+            yield from self.iter_products(collection_id, fields=fields, query=query)
+            return
+
+        self._ensure_catalog_fresh(collection_id, max_age)
+        products = self.catalog.iter_products(catalog_scope(collection_id))
+        if query is not None:
+            # 快照是完整的鏡像，條件在本機套用（不會多傳任何資料）
+            products = filter(query.matches, products)
+        yield from products
+
+    def _ensure_catalog_fresh(self, collection_id, max_age):
+        """
+        快照太舊時先同步（超過 CATALOG_FULL_SYNC_INTERVAL 做完整同步，否則增量）
+        已經有快照時，同步失敗只會警告並繼續用舊快照
+
+        Raises:
+            ShopifyError: 從未同步過且這次同步失敗
+        """
+        state = self.catalog.get_sync_state(catalog_scope(collection_id))
+        now = time.time()
+        try:
+            if not state or now - (state.get('full_synced_at') or 0) > CATALOG_FULL_SYNC_INTERVAL:
+                self.sync_catalog(collection_id, full=True)
+            elif now - (state.get('synced_at') or 0) > max_age:
+                self.sync_catalog(collection_id)
+        except ShopifyError as e:
+            if not state:
+                raise
+            age = int(now - (state.get('synced_at') or 0))
+            print(f"[Catalog] ⚠️  同步失敗，先使用 {age} 秒前的快照: {e}")
+
+    def get_newest_products(self, collection_id, n=20, fields='selector', max_age=300, query=None):
+        """
+        取得系列中最新上架的前 n 個商品，成本不會隨系列大小增加
+        有本機快照時直接讀快照；否則用 GraphQL collection.products(sortKey: CREATED, reverse: true)
+        有篩選條件時改用 products(query:)，不符合的商品由 Shopify 排除
+
+        Args:
+            collection_id: 系列 ID
+            n: 商品數量
+            fields: 欄位組合（'selector' 不含 body_html）
+            max_age: 快照可接受的最大秒數
+            query: ProductQuery 篩選條件（回傳的 n 個都符合條件）
+
+        Returns:
+            商品列表（新的優先，格式與 products.json 相同）
+
+        Raises:
+            ShopifyError: 請求失敗（沒有快照可用時）
+        """
+        if self.catalog:
+            self._ensure_catalog_fresh(collection_id, max_age)
+            if query is None:
+                return self.catalog.get_newest_products(catalog_scope(collection_id), n)
+            products = self.catalog.iter_products(catalog_scope(collection_id), batch_size=max(n, 50))
+            return list(islice(filter(query.matches, products), n))
+
+        products = None
+        if self.access_token:
+            try:
+                products = self._graphql_newest_products(collection_id, n, fields, query)
+            except (ShopifyGraphQLError, ShopifyClientError) as e:
+                # 查詢被拒（權限、API 版本）才改用 REST；網路或限流問題重試後會直接丟出
+                print(f"[Catalog] GraphQL 查詢失敗，改用 products.json: {e}")
+
+        if products is None:
+            # GraphQL 不可用時退回逐頁抓取，只保留最新的 n 個
+            products = self.iter_products(collection_id, fields=fields, query=query)
+            return heapq.nlargest(n, products, key=created_at_key)
+        return products
+
+    def _graphql_newest_products(self, collection_id, n, fields, query=None):
+        """
+        用 GraphQL 取得最新的 n 個商品，每頁 NEWEST_QUERY_PAGE_SIZE 個、用 after 游標翻頁
+
+        Returns:
+            商品列表（新的優先），沒有 Admin API Token 時回傳 None
+        """
+        description = fields != 'selector'
+        if query is None:
+            document = gql.newest_in_collection_query(description=description)
+            variables = {'id': gql.to_gid('Collection', collection_id)}
+        else:
+            document = gql.newest_products_query(description=description)
+            variables = {'query': query.search_string(collection_id)}
+
+        deadline = self.retry_policy.new_deadline()
+        products = []
+        after = None
+        while len(products) < n:
+            variables.update(first=min(NEWEST_QUERY_PAGE_SIZE, n - len(products)), after=after)
+            data = self._graphql_request(document, variables, deadline=deadline)
+            if data is None:
+                return None
+            connection = data.get('products') if query is not None else (data.get('collection') or {}).get('products')
+            if not connection:
+                break
+            products.extend(gql.node_to_rest_product(edge['node']) for edge in connection['edges'])
+            page_info = connection.get('pageInfo') or {}
+            if not page_info.get('hasNextPage'):
+                break
+            after = page_info.get('endCursor')
+        return products
+
+    def get_catalog_products(self, collection_id=None, max_age=300, fields='full', query=None):
+        """
+        從本機快照取得商品，快照過期時先做增量同步
+        沒有設定快照時，直接向 Shopify 抓取
+
+        Args:
+            collection_id: 系列 ID（None = 全部商品）
+            max_age: 快照可接受的最大秒數，超過就先增量同步
+            fields: 直接向 Shopify 抓取時的欄位組合
+                    （快照本身固定用 CATALOG_FIELD_PROFILE）
+            query: ProductQuery 篩選條件
+
+        Returns:
+            商品列表（按上架時間排序，新的優先）
+        """
+        return list(self.iter_catalog_products(collection_id, max_age, fields, query))
+
+    def apply_product_update(self, product):
+        """
+        把 products/create、products/update Webhook 的商品寫進本機快照
+        只更新商品資料（已在的 scope 不變），成員資格交給 refresh_product_scopes()
+
+        Args:
+            product: Webhook payload（REST 格式的商品）
+
+        Returns:
+            是否寫入（payload 比快照舊時不覆蓋）
+        """
+        if not self.catalog or not product.get('id'):
+            return False
+
+        return self.catalog.upsert_products([catalog_product(product)], only_newer=True) > 0
+
+    def membership_fields_changed(self, product):
+        """
+        Webhook 的商品和快照相比，smart collection 規則用到的欄位有沒有改
+        （商品的標籤、類型、廠商、標題，以及各款式的價格、原價、庫存、重量、名稱；
+        只改了說明、圖片等欄位時不會讓商品進出系列，不必重新確認）
+
+        Args:
+            product: Webhook payload（REST 格式的商品）
+
+        Returns:
+            True = 有改、或快照裡沒有這個商品
+        """
+        if not self.catalog:
+            return True
+        current = self.catalog.get_product(product['id'])
+        if current is None:
+            return True
+
+        for field in MEMBERSHIP_FIELDS:
+            if field not in product:
+                continue
+            if field == 'tags':
+                if product_tags(product) != product_tags(current):
+                    return True
+            elif (product.get(field) or '').strip() != (current.get(field) or '').strip():
+                return True
+
+        if 'variants' in product:
+            return self._variant_rule_fields(product) != self._variant_rule_fields(current)
+        return False
+
+    @staticmethod
+    def _variant_rule_fields(product):
+        """各款式中 smart collection 規則會用到的欄位 {variant_id: (...)}"""
+        return {
+            v.get('id'): tuple(str(v.get(field) or '') for field in MEMBERSHIP_VARIANT_FIELDS)
+            for v in product.get('variants') or []
         }
 
+    def refresh_product_scopes(self, product_id):
+        """
+        重新確認商品在每個已同步 scope 的成員資格（標籤改了可能進出 smart collection）
+        每個系列 scope 一次 products.json?collection_id=&ids= 的小請求
+
+        Returns:
+            商品目前所在的 scope 列表
+        """
+        if not self.catalog:
+            return []
+
+        product_id = int(product_id)
+        forget_membership(self.store_url, product_id=product_id)
+
+        member, other = [], []
+        for scope in self.catalog.scopes():
+            if scope == ALL_PRODUCTS_SCOPE:
+                member.append(scope)
+                continue
+            try:
+                in_scope = self.is_product_in_collection(product_id, int(scope), fresh=True)
+            except ShopifyError as e:
+                # 查不到就維持原狀，等下次完整同步修正
+                print(f"[Catalog] ⚠️  無法確認商品 {product_id} 是否在系列 {scope}: {e}")
+                continue
+            (member if in_scope else other).append(scope)
+
+        self.catalog.set_product_scopes(product_id, add=member, remove=other)
+        return member
+
+    def apply_product_delete(self, product_id):
+        """products/delete Webhook：從本機快照刪除商品"""
+        forget_membership(self.store_url, product_id=product_id)
+        if not self.catalog:
+            return False
+        return self.catalog.delete_product(product_id)
+
+    def apply_collection_update(self, collection):
+        """
+        collections/create、collections/update Webhook
+        系列索引在背景重新載入；smart collection 規則可能改了，該系列的快照下次讀取時完整同步
+        """
+        collection_id = int(collection['id'])
+        self.collection_index.invalidate()
+        forget_membership(self.store_url, collection_id=collection_id)
+        if self.catalog:
+            self.catalog.expire_scope(catalog_scope(collection_id))
+
+    def apply_collection_delete(self, collection_id):
+        """collections/delete Webhook：移除該系列的快照與快取"""
+        collection_id = int(collection_id)
+        self.collection_index.invalidate()
+        forget_membership(self.store_url, collection_id=collection_id)
+        if self.catalog:
+            self.catalog.drop_scope(catalog_scope(collection_id))
+
+    def _fetch_collection_pages(self, kind, limit=250):
+        """
+        用 since_id 翻頁抓取 custom_collections / smart_collections
+
+        Args:
+            kind: 'custom_collections' 或 'smart_collections'
+            limit: 每頁數量（最大 250）
+
+        Returns:
+            系列列表
+
+        Raises:
+            ShopifyError: 任何一頁失敗
+        """
+        params = {'limit': limit}
+        collections = []
+        deadline = self.retry_policy.new_deadline()
+
         while True:
-            data = self._make_request('products.json', params)
-            if not data or 'products' not in data:
-                break
+            data = self._make_request(f'{kind}.json', params, deadline=deadline)
+            if kind not in data:
+                raise ShopifyError(f"{kind}.json 回應缺少 {kind}")
 
-            products = data['products']
-            all_products.extend(products)
+            page = data[kind]
+            collections.extend(page)
 
-            if len(products) < limit:
-                break
+            if len(page) < limit:
+                return collections
+
+            params['since_id'] = page[-1]['id']
+
+    def _load_collections(self):
+        """載入完整系列列表，任何一頁失敗就回傳 None（給系列索引用）"""
+        if not self.access_token:
+            return self._get_collections_from_storefront()
+
+        try:
+            custom = self._fetch_collection_pages('custom_collections')
+            smart = self._fetch_collection_pages('smart_collections')
+        except ShopifyError as e:
+            print(f"取得系列列表失敗: {e}")
+            return None
+        return custom + smart
+
+    @property
+    def collection_index(self):
+        """商店共用的系列索引（handle / 標題 / ID → 系列）"""
+        return get_collection_index(self.store_url, self._load_collections, admin=bool(self.access_token))
+
+    def is_product_in_collection(self, product_id, collection_id, fresh=False):
+        """
+        檢查商品是否在系列中，不需要抓整個系列
+        依序查：記憶體快取 → 本機快照 → 一次 products.json?collection_id=&ids= 的小請求
 
-            params['since_id'] = products[-1]['id']
+        Args:
+            product_id: 商品 ID
+            collection_id: 系列 ID
+            fresh: 略過快取和快照，直接問 Shopify（商品剛被修改時用）
+
+        Returns:
+            True / False
+
+        Raises:
+            ShopifyError: 快取和快照都沒有答案，且查詢失敗
+        """
+        product_id, collection_id = int(product_id), int(collection_id)
+        key = (self.store_url, collection_id, product_id)
+        now = time.time()
+
+        with _membership_lock:
+            cached = None if fresh else _membership_cache.get(key)
+        if cached:
+            is_member, checked_at = cached
+            ttl = MEMBERSHIP_CACHE_TTL if is_member else MEMBERSHIP_NEGATIVE_CACHE_TTL
+            if now - checked_at < ttl:
+                return is_member
+
+        if not fresh and self.catalog and self.catalog.is_member(catalog_scope(collection_id), product_id):
+            is_member = True
+        else:
+            data = self._make_request('products.json', {
+                'collection_id': collection_id,
+                'ids': product_id,
+                'fields': 'id',
+                'limit': 1,
+            })
+            is_member = any(p.get('id') == product_id for p in data.get('products', []))
 
-        return all_products
+        with _membership_lock:
+            # 順便清掉過期的記錄，避免大量匯入時快取無限成長
+            for k in [k for k, (_, ts) in _membership_cache.items() if now - ts > MEMBERSHIP_CACHE_TTL]:
+                del _membership_cache[k]
+            _membership_cache[key] = (is_member, now)
+        return is_member
 
     def get_collections(self):
         """
@@ -121,23 +1256,16 @@ class ShopifyClient:
         Returns:
             系列列表
         """
-        # 先嘗試 Admin API
-        if self.access_token:
-            # Custom collections
-            custom = self._make_request('custom_collections.json', {'limit': 250})
-            # Smart collections
-            smart = self._make_request('smart_collections.json', {'limit': 250})
-
-            collections = []
-            if custom and 'custom_collections' in custom:
-                collections.extend(custom['custom_collections'])
-            if smart and 'smart_collections' in smart:
-                collections.extend(smart['smart_collections'])
+        return self.collection_index.all()
 
-            return collections
+    def resolve_collection(self, key):
+        """
+        用 handle、標題或 ID 找系列（穩定狀態下不需要打 API）
 
-        # Storefront 方式（解析網頁）
-        return self._get_collections_from_storefront()
+        Returns:
+            系列 dict，找不到時回傳 None
+        """
+        return self.collection_index.resolve(key)
 
     def _get_collections_from_storefront(self):
         """從 Storefront 取得系列列表"""
@@ -167,30 +1295,25 @@ class ShopifyClient:
         ]
         return collections
 
-    def get_products_from_collection(self, collection_handle, limit=250):
+    def get_products_from_collection(self, collection_handle, limit=250, fields='full'):
         """
         取得指定系列的商品
 
         Args:
             collection_handle: 系列的 handle
             limit: 商品數量限制
+            fields: 欄位組合（只對 Admin API 有效）
 
         Returns:
             商品列表
         """
         if self.access_token:
-            # Admin API 方式
-            # 先取得 collection ID
-            collections = self.get_collections()
-            collection_id = None
-
-            for col in collections:
-                if col.get('handle') == collection_handle:
-                    collection_id = col.get('id')
-                    break
+            # Admin API 方式：從系列索引取得 collection ID
+            collection = self.collection_index.get_by_handle(collection_handle)
+            collection_id = collection.get('id') if collection else None
 
             if collection_id:
-                return self.get_products_by_collection_id(collection_id, limit)
+                return self.get_products_by_collection_id(collection_id, limit, fields=fields)
 
         # Storefront 方式（使用公開的 JSON endpoint）
         encoded_handle = quote(collection_handle, safe='')
@@ -205,25 +1328,63 @@ class ShopifyClient:
             print(f"取得系列商品失敗: {e}")
             return []
 
-    def get_product_by_id(self, product_id):
+    def get_product_by_id(self, product_id, fields='full'):
         """
         取得特定商品
 
         Args:
             product_id: 商品 ID
+            fields: 欄位組合（'selector' / 'render' / 'full'）
 
         Returns:
-            商品資料
+            商品資料，商品不存在時回傳 None
+
+        Raises:
+            ShopifyError: 請求失敗
         """
         if self.access_token:
             endpoint = f'products/{product_id}.json'
-            data = self._make_request(endpoint)
+            try:
+                data = self._make_request(endpoint, product_fields_params(fields))
+            except ShopifyNotFoundError:
+                return None
             if data and 'product' in data:
                 return data['product']
 
         # Storefront 不支援直接用 ID 查詢
         return None
 
+    def get_products_by_ids(self, product_ids, fields='full'):
+        """
+        一次取得多個商品（products.json?ids=，每 PRODUCT_IDS_CHUNK_SIZE 個一個請求）
+
+        Args:
+            product_ids: 商品 ID 列表（重複的 ID 只查一次）
+            fields: 欄位組合（'selector' / 'render' / 'full'）
+
+        Returns:
+            (products, missing_ids)
+            products: 依輸入順序排列的商品列表
+            missing_ids: 找不到（不存在或已刪除）的商品 ID
+
+        Raises:
+            ShopifyError: 請求失敗
+        """
+        ids = list(dict.fromkeys(int(pid) for pid in product_ids))
+        if not self.access_token:
+            print("需要 Admin API Token 才能用 ID 查詢商品")
+            return [], ids
+
+        products = []
+        deadline = self.retry_policy.new_deadline()
+        for start in range(0, len(ids), PRODUCT_IDS_CHUNK_SIZE):
+            chunk = ids[start:start + PRODUCT_IDS_CHUNK_SIZE]
+            params = dict(product_fields_params(fields), ids=','.join(map(str, chunk)), limit=len(chunk))
+            data = self._make_request('products.json', params, deadline=deadline)
+            products.extend(data.get('products', []))
+
+        return order_by_ids(ids, products)
+
     def get_product_by_handle(self, handle):
         """
         透過 handle 取得商品
@@ -246,82 +1407,109 @@ class ShopifyClient:
             print(f"取得商品失敗: {e}")
             return None
 
-    def add_tag_to_product(self, product_id, new_tag):
+    def get_product_tags(self, product_ids):
         """
-        為商品新增標籤
+        用 GraphQL nodes(ids:) 一次取得多個商品目前的標籤
 
         Args:
-            product_id: 商品 ID
-            new_tag: 要新增的標籤
+            product_ids: 商品 ID 列表
 
         Returns:
-            是否成功
+            {product_id: [tag, ...]}，找不到的商品不會出現在結果中
+
+        Raises:
+            ShopifyError: 請求失敗
+        """
+        tags_by_id = {}
+        ids = [int(pid) for pid in product_ids]
+
+        for start in range(0, len(ids), TAG_QUERY_CHUNK_SIZE):
+            chunk = ids[start:start + TAG_QUERY_CHUNK_SIZE]
+            data = self._graphql_request(
+                gql.PRODUCT_TAGS_QUERY,
+                {'ids': [gql.to_gid('Product', pid) for pid in chunk]},
+            )
+            for node in (data or {}).get('nodes') or []:
+                if node and node.get('id'):
+                    tags_by_id[gql.gid_to_id(node['id'])] = node.get('tags') or []
+
+        return tags_by_id
+
+    def batch_update_tags(self, operations):
         """
+        批次新增 / 移除多個商品的標籤
+        用 GraphQL tagsAdd / tagsRemove，多個操作合併成一個 mutation 送出
+
+        Args:
+            operations: [{'product_id': 123, 'add': ['標籤'], 'remove': ['標籤']}, ...]
+
+        Returns:
+            {product_id: {'success': bool, 'error': str 或 None}}
+        """
+        results, batches = plan_tag_mutations(operations)
+
         if not self.access_token:
-            print("需要 Admin API Token 才能新增標籤")
-            return False
+            print("需要 Admin API Token 才能修改標籤")
+            return {pid: {'success': False, 'error': '缺少 Admin API Token'} for pid in results}
+
+        for chunk, mutation, variables in batches:
+            try:
+                data = self._graphql_request(mutation, variables)
+            except ShopifyError as e:
+                collect_tag_results(results, chunk, None, failure=e)
+                continue
+            collect_tag_results(results, chunk, data)
 
-        # 確保 product_id 是整數
-        product_id = int(product_id)
+        report_tag_results(results)
+        return results
 
-        # 先取得商品目前的標籤
-        product = self.get_product_by_id(product_id)
-        if not product:
-            print(f"找不到商品: {product_id}")
-            return False
+    def add_tag_to_products(self, product_ids, new_tag):
+        """
+        為多個商品新增同一個標籤（已存在的標籤不會重複）
 
-        current_tags = product.get('tags', '')
-        if isinstance(current_tags, list):
-            tag_list = current_tags
-        else:
-            tag_list = [t.strip() for t in current_tags.split(',') if t.strip()]
+        Returns:
+            {product_id: {'success': bool, 'error': str 或 None}}
+        """
+        return self.batch_update_tags([{'product_id': pid, 'add': [new_tag]} for pid in product_ids])
 
-        # 如果標籤已存在，不重複新增
-        if new_tag in tag_list:
-            print(f"標籤已存在: {new_tag}")
-            return True
+    def remove_tags_with_prefix_from_products(self, product_ids, prefix):
+        """
+        移除多個商品中符合前綴的標籤
 
-        # 新增標籤
-        tag_list.append(new_tag)
-        new_tags = ', '.join(tag_list)
+        Returns:
+            {product_id: {'success': bool, 'error': str 或 None}}
+        """
+        ids = [int(pid) for pid in product_ids]
+        try:
+            current_tags = self.get_product_tags(ids)
+        except ShopifyError as e:
+            print(f"取得標籤失敗: {e}")
+            return {pid: {'success': False, 'error': f'取得標籤失敗: {e}'} for pid in ids}
+        results, operations = plan_prefix_removal(ids, current_tags, prefix)
+        results.update(self.batch_update_tags(operations))
+        return {pid: results[pid] for pid in ids}
 
-        # 使用 REST API 更新標籤
-        url = f"{self.store_url}/admin/api/2024-10/products/{product_id}.json"
+    def add_tag_to_product(self, product_id, new_tag):
+        """
+        為商品新增標籤
 
-        payload = {
-            'product': {
-                'id': product_id,
-                'tags': new_tags
-            }
-        }
+        Args:
+            product_id: 商品 ID
+            new_tag: 要新增的標籤
 
-        print(f"[DEBUG] URL: {url}")
-        print(f"[DEBUG] Payload: {payload}")
-        print(f"[DEBUG] Current tags count: {len(tag_list)}")
+        Returns:
+            是否成功
+        """
+        product_id = int(product_id)
+        result = self.add_tag_to_products([product_id], new_tag)[product_id]
 
-        try:
-            import json as json_module
-            headers = {
-                'X-Shopify-Access-Token': self.access_token,
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            }
-            response = requests.put(url, data=json_module.dumps(payload), headers=headers, timeout=30)
-
-            print(f"[DEBUG] Response status: {response.status_code}")
-            print(f"[DEBUG] Response headers: {dict(response.headers)}")
-            print(f"[DEBUG] Response body: {response.text[:500]}")
-
-            if not response.ok:
-                print(f"新增標籤失敗: {response.status_code} - {response.text}")
-                return False
-
-            print(f"✅ 標籤新增成功: {new_tag}")
-            return True
-        except Exception as e:
-            print(f"新增標籤失敗: {e}")
+        if not result['success']:
+            print(f"新增標籤失敗: {result['error']}")
             return False
 
+        print(f"✅ 標籤新增成功: {new_tag}")
+        return True
+
     def remove_tags_with_prefix(self, product_id, prefix):
         """
         移除商品中符合前綴的標籤
@@ -333,88 +1521,110 @@ class ShopifyClient:
         Returns:
             是否成功
         """
-        if not self.access_token:
-            print("需要 Admin API Token 才能移除標籤")
-            return False
-
-        # 確保 product_id 是整數
         product_id = int(product_id)
+        result = self.remove_tags_with_prefix_from_products([product_id], prefix)[product_id]
 
-        product = self.get_product_by_id(product_id)
-        if not product:
-            return False
-
-        current_tags = product.get('tags', '')
-        if isinstance(current_tags, list):
-            tag_list = current_tags
-        else:
-            tag_list = [t.strip() for t in current_tags.split(',') if t.strip()]
+        if not result['success']:
+            print(f"移除標籤失敗: {result['error']}")
+        return result['success']
 
-        # 過濾掉符合前綴的標籤
-        new_tag_list = [t for t in tag_list if not t.startswith(prefix)]
+    def _newest_in_collection_handle(self, handle, n, fields, max_age):
+        """一個系列最新的 n 個商品（新的優先），給多系列合併用"""
+        if self.access_token:
+            collection = self.collection_index.get_by_handle(handle)
+            if collection and collection.get('id'):
+                return self.get_newest_products(collection['id'], n=n, fields=fields, max_age=max_age)
+
+        # Storefront 的順序是系列設定的排序，自己依上架時間排
+        products = self.get_products_from_collection(handle, n, fields=fields)
+        return heapq.nlargest(n, products, key=created_at_key)
+
+    def _all_in_collection_handle(self, handle, limit, fields, max_age):
+        """一個系列的全部商品（新的優先），給多系列合併用"""
+        if self.access_token and self.catalog:
+            collection = self.collection_index.get_by_handle(handle)
+            if collection and collection.get('id'):
+                products = self.iter_catalog_products(collection['id'], max_age, fields)
+                return sorted(products, key=created_at_key, reverse=True)
+
+        products = self.get_products_from_collection(handle, limit, fields=fields)
+        return sorted(products, key=created_at_key, reverse=True)
+
+    def _collection_handles(self, collection_names):
+        """系列名稱 → 不重複的 handle 列表（找不到的略過）"""
+        handles = []
+        for name in collection_names:
+            handle = self._find_collection_handle(name)
+            if handle and handle not in handles:
+                handles.append(handle)
+        return handles
 
-        if len(new_tag_list) == len(tag_list):
-            # 沒有變化
-            return True
+    def _merge_collection_streams(self, handles, fetch):
+        """
+        同時抓取多個系列，依上架時間合併（新的優先）
 
-        new_tags = ', '.join(new_tag_list)
+        Args:
+            handles: 系列 handle 列表
+            fetch: fetch(handle) 回傳該系列新的優先的商品列表
 
-        url = f"{self.store_url}/admin/api/2024-10/products/{product_id}.json"
-        payload = {
-            'product': {
-                'id': product_id,
-                'tags': new_tags
-            }
-        }
+        Yields:
+            商品 dict（同一個商品在好幾個系列裡時只出現一次）
+        """
+        if not handles:
+            return
 
-        try:
-            import json as json_module
-            headers = {
-                'X-Shopify-Access-Token': self.access_token,
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            }
-            response = requests.put(url, data=json_module.dumps(payload), headers=headers, timeout=30)
-
-            if not response.ok:
-                print(f"移除標籤失敗: {response.status_code} - {response.text}")
-                return False
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_FETCH_WORKERS, len(handles))) as pool:
+            streams = list(pool.map(fetch, handles))
 
-            return True
-        except Exception as e:
-            print(f"移除標籤失敗: {e}")
-            return False
+        seen_ids = set()
+        for product in heapq.merge(*streams, key=created_at_key, reverse=True):
+            if product['id'] in seen_ids:
+                continue
+            seen_ids.add(product['id'])
+            yield product
 
-    def get_products_from_multiple_collections(self, collection_names, limit=250):
+    def iter_products_from_multiple_collections(self, collection_names, limit=250, fields='full', max_age=300):
         """
-        取得多個系列的商品（按上架時間排序，新的優先）
+        同時抓取多個系列最新的商品，依上架時間合併（新的優先、已用 ID 去重）
+        每個系列最多抓 limit 個，抓完後用 heapq.merge 逐一合併，
+        呼叫端只讀前幾個時不會排序全部商品
 
         Args:
             collection_names: 系列名稱列表
-            limit: 商品數量限制
+            limit: 每個系列最多取幾個（也是合併後最多幾個）
+            fields: 欄位組合
+            max_age: 本機快照可接受的最大秒數
 
-        Returns:
-            商品列表（按上架時間排序）
-        """
-        all_products = []
-        seen_ids = set()
+        Yields:
+            商品 dict
 
-        for name in collection_names:
-            # 尋找對應的 handle
-            handle = self._find_collection_handle(name)
-            if not handle:
-                continue
+        Raises:
+            ShopifyError: 任何一個系列抓取失敗
+        """
+        handles = self._collection_handles(collection_names)
+        products = self._merge_collection_streams(
+            handles, lambda handle: self._newest_in_collection_handle(handle, limit, fields, max_age),
+        )
+        yield from islice(products, limit)
 
-            products = self.get_products_from_collection(handle, limit)
-            for p in products:
-                if p['id'] not in seen_ids:
-                    seen_ids.add(p['id'])
-                    all_products.append(p)
+    def get_products_from_multiple_collections(self, collection_names, limit=250, fields='full', max_age=300):
+        """
+        取得多個系列的全部商品（按上架時間排序，新的優先）
+        只需要最新幾個時用 iter_products_from_multiple_collections()
 
-        # 按上架時間排序（新的優先）
-        all_products.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        Args:
+            collection_names: 系列名稱列表
+            limit: 每頁商品數量（直接向 Shopify 抓取時）
+            fields: 欄位組合
+            max_age: 本機快照可接受的最大秒數
 
-        return all_products
+        Returns:
+            商品列表（按上架時間排序）
+        """
+        handles = self._collection_handles(collection_names)
+        return list(self._merge_collection_streams(
+            handles, lambda handle: self._all_in_collection_handle(handle, limit, fields, max_age),
+        ))
 
     def _find_collection_handle(self, name):
         """
@@ -426,41 +1636,19 @@ class ShopifyClient:
         Returns:
             handle 字串
         """
-        # 名稱對應表
-        name_to_handle = {
-            '小倉山莊': '小倉山莊',
-            'YOKUMOKU': 'yokumoku',
-            '砂糖奶油樹': '砂糖奶油樹',
-            '坂角總本舖': '坂角總本舖',
-            '神戶風月堂': '神戶風月堂',
-            '銀座菊廼舍': '銀座菊廼舍',
-            '資生堂PARLOUR': '資生堂parlour',
-            '虎屋羊羹': '虎屋羊羹',
-            'FRANCAIS': 'francais',
-            'COCORIS': 'cocoris',
-            'Gateau Festa Harada': 'gateau-festa-harada',
-            'The maple mania 楓糖男孩': 'the-maple-mania-楓糖男孩',
-            'Human Made': 'human-made-1',
-            'X-girl': 'x-girl',
-            "BAPE Men's": 'bape',
-            "BAPE Women's": 'bape',
-            "BAPE kids": 'bape',
-            'work man 作業服': 'workman-作業服',
-            'work man 男裝': 'workman-男裝',
-            'work man 女裝': 'workman-女裝',
-            'work man 兒童': 'workman-兒童',
-            'adidas 男鞋': 'adidas-男鞋',
-            'adidas 女鞋': 'adidas-女鞋',
-        }
-
         # 先嘗試直接對應
-        if name in name_to_handle:
-            return name_to_handle[name]
+        if name in COLLECTION_NAME_TO_HANDLE:
+            return COLLECTION_NAME_TO_HANDLE[name]
 
         # 嘗試忽略大小寫
-        for key, value in name_to_handle.items():
-            if key.lower() == name.lower():
-                return value
+        handle = _COLLECTION_NAME_TO_HANDLE_LOWER.get(name.lower())
+        if handle:
+            return handle
+
+        # 嘗試用系列標題比對
+        collection = self.collection_index.get_by_title(name)
+        if collection and collection.get('handle'):
+            return collection['handle']
 
         # 嘗試用名稱作為 handle
         return name.lower().replace(' ', '-')
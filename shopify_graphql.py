@@ -0,0 +1,254 @@
+"""
+Shopify GraphQL Admin API 工具
+GraphQL 查詢字串、global ID 轉換、把 GraphQL 節點轉成 REST products.json 的格式
+"""
+
+import json
+
+BULK_RUN_MUTATION = """
+mutation bulkRun($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_STATUS_QUERY = """
+query bulkStatus($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+  }
+}
+"""
+
+PRODUCT_TAGS_QUERY = """
+query productTags($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    ... on Product { id tags }
+  }
+}
+"""
+
+# Bulk operation 結束（不會再變動）的狀態
+BULK_FINISHED_STATUSES = {'COMPLETED', 'FAILED', 'CANCELED', 'EXPIRED'}
+
+
+def to_gid(resource, legacy_id):
+    """數字 ID → global ID（例如 gid://shopify/Product/123）"""
+    return f"gid://shopify/{resource}/{int(legacy_id)}"
+
+
+def gid_type(gid):
+    """取出 global ID 的資源類型（gid://shopify/Product/123 → Product）"""
+    parts = (gid or '').split('/')
+    return parts[3] if len(parts) > 4 else None
+
+
+def gid_to_id(gid):
+    """global ID → 數字 ID，格式不符時回傳 None"""
+    try:
+        return int(str(gid).rsplit('/', 1)[-1].split('?')[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def product_fields(images_first=None, variants_first=None, description=True):
+    """
+    商品欄位選擇（Bulk 查詢不能帶 first，一般查詢一定要帶）
+
+    Args:
+        images_first: 圖片數量上限（None = bulk 模式）
+        variants_first: 規格數量上限（None = bulk 模式）
+        description: 是否包含 descriptionHtml（選品用不到）
+    """
+    images_args = f"(first: {images_first})" if images_first else ''
+    variants_args = f"(first: {variants_first})" if variants_first else ''
+    description_field = 'descriptionHtml' if description else ''
+    return f"""
+      id
+      title
+      handle
+      {description_field}
+      createdAt
+      updatedAt
+      publishedAt
+      tags
+      productType
+      vendor
+      status
+      images{images_args} {{ edges {{ node {{ id url altText width height }} }} }}
+      variants{variants_args} {{ edges {{ node {{ id title price sku position }} }} }}
+    """
+
+
+def tags_mutation(operations):
+    """
+    把多個 tagsAdd / tagsRemove 組成一個 mutation（每個操作用別名 t0、t1…區分）
+
+    Args:
+        operations: [(mutation_name, product_gid, tags), ...]
+                    mutation_name 為 'tagsAdd' 或 'tagsRemove'
+
+    Returns:
+        (mutation 字串, variables dict)
+    """
+    declarations = []
+    fields = []
+    variables = {}
+    for i, (name, gid, tags) in enumerate(operations):
+        declarations.append(f"$id{i}: ID!, $tags{i}: [String!]!")
+        fields.append(
+            f"t{i}: {name}(id: $id{i}, tags: $tags{i}) {{ node {{ id }} userErrors {{ field message }} }}"
+        )
+        variables[f'id{i}'] = gid
+        variables[f'tags{i}'] = list(tags)
+
+    mutation = f"mutation tagsBatch({', '.join(declarations)}) {{\n  " + "\n  ".join(fields) + "\n}"
+    return mutation, variables
+
+
+def newest_in_collection_query(images_first=10, variants_first=1, description=False):
+    """系列中最新上架的商品（sortKey: CREATED, reverse: true），用 $after 翻頁"""
+    fields = product_fields(images_first, variants_first, description)
+    return f"""
+query newestInCollection($id: ID!, $first: Int!, $after: String) {{
+  collection(id: $id) {{
+    products(first: $first, after: $after, sortKey: CREATED, reverse: true) {{
+      edges {{ node {{ {fields} }} }}
+      pageInfo {{ hasNextPage endCursor }}
+    }}
+  }}
+}}
+"""
+
+
+def newest_products_query(images_first=10, variants_first=1, description=False):
+    """
+    符合搜尋條件的最新商品（products(query:)，條件由 Shopify 端過濾）
+    搜尋語法見 ProductQuery.search_string()，用 $after 翻頁
+    """
+    fields = product_fields(images_first, variants_first, description)
+    return f"""
+query newestProducts($first: Int!, $after: String, $query: String) {{
+  products(first: $first, after: $after, sortKey: CREATED_AT, reverse: true, query: $query) {{
+    edges {{ node {{ {fields} }} }}
+    pageInfo {{ hasNextPage endCursor }}
+  }}
+}}
+"""
+
+
+def bulk_products_query(collection_id=None):
+    """
+    Bulk operation 用的商品查詢
+
+    Args:
+        collection_id: 只匯出這個系列（None = 全部商品）
+    """
+    products = f"products {{ edges {{ node {{ {product_fields()} }} }} }}"
+    if collection_id is None:
+        return f"{{ {products} }}"
+    return f'{{ collection(id: "{to_gid("Collection", collection_id)}") {{ {products} }} }}'
+
+
+def _image_to_rest(node, position):
+    return {
+        'id': gid_to_id(node.get('id')),
+        'src': node.get('url') or node.get('src'),
+        'alt': node.get('altText'),
+        'width': node.get('width'),
+        'height': node.get('height'),
+        'position': position,
+    }
+
+
+def _variant_to_rest(node, position):
+    return {
+        'id': gid_to_id(node.get('id')),
+        'title': node.get('title'),
+        'price': node.get('price'),
+        'sku': node.get('sku'),
+        'position': node.get('position') or position,
+    }
+
+
+def _edges(connection):
+    if not connection:
+        return []
+    return [edge['node'] for edge in connection.get('edges', []) if edge.get('node')]
+
+
+def node_to_rest_product(node):
+    """
+    GraphQL Product 節點 → REST products.json 格式的商品 dict
+
+    images / variants 可以是 connection（一般查詢）或已展開的 list（bulk 匯出）
+    """
+    images = node.get('images')
+    variants = node.get('variants')
+    image_nodes = images if isinstance(images, list) else _edges(images)
+    variant_nodes = variants if isinstance(variants, list) else _edges(variants)
+
+    tags = node.get('tags') or []
+    status = node.get('status')
+
+    return {
+        'id': gid_to_id(node.get('id')),
+        'title': node.get('title'),
+        'handle': node.get('handle'),
+        'body_html': node.get('descriptionHtml'),
+        'created_at': node.get('createdAt'),
+        'updated_at': node.get('updatedAt'),
+        'published_at': node.get('publishedAt'),
+        'tags': ', '.join(tags) if isinstance(tags, list) else tags,
+        'product_type': node.get('productType'),
+        'vendor': node.get('vendor'),
+        'status': status.lower() if status else None,
+        'images': [_image_to_rest(n, i) for i, n in enumerate(image_nodes, 1)],
+        'variants': [_variant_to_rest(n, i) for i, n in enumerate(variant_nodes, 1)],
+    }
+
+
+def parse_bulk_products(lines):
+    """
+    逐行解析 bulk operation 的 JSONL 結果，一次 yield 一個商品
+
+    Shopify 會把子節點（圖片、規格）放在父商品之後、用 __parentId 指回父商品，
+    所以只需要保留「目前這一個」商品在記憶體裡
+
+    Args:
+        lines: JSONL 行（檔案物件、response.iter_lines() 等）
+
+    Yields:
+        REST 格式的商品 dict
+    """
+    current = None
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+
+        node = json.loads(line)
+        kind = gid_type(node.get('id'))
+
+        if kind == 'Product':
+            if current is not None:
+                yield node_to_rest_product(current)
+            current = dict(node, images=[], variants=[])
+            continue
+
+        if current is None or node.get('__parentId') != current['id']:
+            # 例如系列本身的那一行，或不認得的子節點
+            continue
+
+        if kind in ('ProductImage', 'MediaImage'):
+            current['images'].append(node)
+        elif kind == 'ProductVariant':
+            current['variants'].append(node)
+
+    if current is not None:
+        yield node_to_rest_product(current)
@@ -0,0 +1,113 @@
+"""
+Shopify REST API 呼叫額度控制（leaky bucket）
+
+Shopify 每個商店有一個呼叫額度 bucket（標準方案 40 次，每秒回復 2 次），
+目前用量會放在 X-Shopify-Shop-Api-Call-Limit 回應標頭（例如 "32/40"）。
+同一個商店的所有 ShopifyClient、所有 thread 共用同一個 bucket，
+在 bucket 快滿之前先等待，而不是等到 429 才處理。
+"""
+
+import threading
+import time
+
+# 標準方案的 bucket 大小與每秒回復次數
+DEFAULT_BUCKET_SIZE = 40
+DEFAULT_LEAK_RATE = 2.0
+
+# 保留幾次額度不用，留給其他 process（gunicorn 其他 worker、CLI）
+DEFAULT_HEADROOM = 4
+
+CALL_LIMIT_HEADER = 'X-Shopify-Shop-Api-Call-Limit'
+
+
+class LeakyBucket:
+    """單一商店的呼叫額度（thread-safe）"""
+
+    def __init__(self, capacity=DEFAULT_BUCKET_SIZE, leak_rate=DEFAULT_LEAK_RATE, headroom=DEFAULT_HEADROOM):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.headroom = headroom
+        self._level = 0.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _leak(self, now):
+        elapsed = now - self._updated
+        self._level = max(0.0, self._level - elapsed * self.leak_rate)
+        self._updated = now
+
+    def reserve(self):
+        """
+        預約一次呼叫
+
+        Returns:
+            發送前需要等待的秒數（0 = 可以馬上發送）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._leak(now)
+
+            limit = max(1, self.capacity - self.headroom)
+            overflow = self._level + 1 - limit
+            wait = overflow / self.leak_rate if overflow > 0 else 0.0
+            wait = max(wait, self._blocked_until - now)
+
+            # 先把這次呼叫算進 bucket，讓同時在等的其他 thread 排在後面
+            self._level += 1
+            return wait
+
+    def acquire(self):
+        """等到可以發送為止，回傳實際等待的秒數"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def update(self, headers):
+        """用回應標頭校正目前用量"""
+        value = headers.get(CALL_LIMIT_HEADER)
+        if not value:
+            return
+
+        try:
+            used, capacity = (int(x) for x in value.split('/'))
+        except ValueError:
+            return
+
+        with self._lock:
+            self._leak(time.monotonic())
+            self.capacity = capacity
+            # 自己的估計已包含還在路上的呼叫；伺服器的數字包含其他 process 的用量，取較大值
+            self._level = max(self._level, float(used))
+
+    def block_for(self, seconds):
+        """收到 429 時，讓所有人都暫停 seconds 秒"""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            # bucket 已經滿了：解除封鎖後改成依回復速度一次一個地送
+            self._level = max(self._level, float(self.capacity - self.headroom))
+            self._updated = now
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(store_url):
+    """取得商店共用的 bucket（同一個 process 內只會有一個）"""
+    key = store_url.rstrip('/').lower()
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = LeakyBucket()
+        return bucket
+
+
+def parse_retry_after(headers, default):
+    """讀取 Retry-After 標頭（秒數），沒有或格式錯誤時回傳 default"""
+    try:
+        return max(0.0, float(headers.get('Retry-After', '')))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,205 @@
+"""
+Shopify API 錯誤分類與重試策略
+
+網路斷線、逾時、429、5xx 會依 jitter 指數退避重試；
+重試用完或超過整個操作的期限時丟出對應的 ShopifyError，
+呼叫端可以分辨「請求失敗」和「真的沒有資料」
+"""
+
+import random
+import threading
+import time
+
+
+class ShopifyError(Exception):
+    """Shopify API 請求失敗"""
+
+    retryable = False
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ShopifyConnectionError(ShopifyError):
+    """連線失敗（DNS、連線被拒、連線中斷）"""
+    retryable = True
+
+
+class ShopifyTimeoutError(ShopifyError):
+    """請求逾時"""
+    retryable = True
+
+
+class ShopifyThrottledError(ShopifyError):
+    """被限流（429 或 GraphQL THROTTLED）"""
+    retryable = True
+
+
+class ShopifyServerError(ShopifyError):
+    """Shopify 伺服器錯誤（5xx）"""
+    retryable = True
+
+
+class ShopifyClientError(ShopifyError):
+    """請求本身有問題（4xx，重試也不會成功）"""
+
+
+class ShopifyNotFoundError(ShopifyClientError):
+    """資源不存在（404）"""
+
+
+class ShopifyGraphQLError(ShopifyError):
+    """GraphQL 回應中的 errors（查詢語法、權限等）"""
+
+
+class ShopifyDeadlineExceeded(ShopifyError):
+    """整個操作（例如翻完整個目錄）超過期限"""
+
+
+def error_for_status(status_code, message):
+    """依 HTTP 狀態碼建立對應的錯誤"""
+    if status_code == 429:
+        return ShopifyThrottledError(message, status_code)
+    if status_code == 404:
+        return ShopifyNotFoundError(message, status_code)
+    if status_code >= 500:
+        return ShopifyServerError(message, status_code)
+    return ShopifyClientError(message, status_code)
+
+
+def raise_for_status(response):
+    """4xx / 5xx 時丟出對應的 ShopifyError（requests 和 httpx 的 Response 都適用）"""
+    status = response.status_code
+    if status >= 400:
+        raise error_for_status(status, f"HTTP {status}: {response.text[:200]}")
+
+
+class RetryPolicy:
+    """重試次數、退避時間與操作期限"""
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0,
+                 request_timeout=30.0, operation_timeout=300.0):
+        """
+        Args:
+            max_attempts: 每個請求最多嘗試幾次（含第一次）
+            base_delay: 第一次重試的退避上限（秒），之後每次加倍
+            max_delay: 單次退避的最長秒數
+            request_timeout: 單一 HTTP 請求的逾時秒數
+            operation_timeout: 一個完整操作（含翻頁、重試、等待額度）的期限
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_timeout = request_timeout
+        self.operation_timeout = operation_timeout
+
+    def backoff(self, attempt):
+        """第 attempt 次重試前的等待秒數（full jitter：0 ~ base * 2^attempt）"""
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def new_deadline(self):
+        """從現在開始算的操作期限（time.monotonic() 時間）"""
+        return time.monotonic() + self.operation_timeout
+
+    def timeout_for(self, deadline):
+        """單一請求的逾時：不超過 request_timeout，也不超過剩餘期限"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ShopifyDeadlineExceeded('操作已超過期限')
+        return min(self.request_timeout, remaining)
+
+    def next_delay(self, error, attempt, deadline, retry_after=None):
+        """
+        決定第 attempt 次失敗後是否重試
+
+        Args:
+            error: 這次失敗的 ShopifyError
+            attempt: 已經嘗試的次數
+            deadline: 操作期限（time.monotonic() 時間）
+            retry_after: 伺服器指定的等待秒數（429 的 Retry-After 等）
+
+        Returns:
+            重試前要等待的秒數
+
+        Raises:
+            error 本身（不可重試或次數用完），或 ShopifyDeadlineExceeded（等下去會超過期限）
+        """
+        if not error.retryable or attempt >= self.max_attempts:
+            retry_stats.record_failure()
+            raise error
+
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            retry_stats.record_failure()
+            raise ShopifyDeadlineExceeded(f"操作期限內無法完成（最後一次錯誤：{error}）") from error
+
+        retry_stats.record_retry(error)
+        print(f"[Retry] {error}，{delay:.1f} 秒後重試（第 {attempt} 次）")
+        return delay
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+class RetryStats:
+    """跨 thread 的重試統計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.retries = 0
+            self.retries_by_reason = {}
+            self.failures = 0
+            self.throttled_seconds = 0.0
+            self.backoff_seconds = 0.0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_retry(self, error):
+        reason = type(error).__name__
+        with self._lock:
+            self.retries += 1
+            self.retries_by_reason[reason] = self.retries_by_reason.get(reason, 0) + 1
+
+    def record_wait(self, seconds, throttled=True):
+        """
+        記錄等待時間
+
+        Args:
+            seconds: 等待秒數
+            throttled: True = 被限流（429、排隊等呼叫額度），False = 錯誤後的退避
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            if throttled:
+                self.throttled_seconds += seconds
+            else:
+                self.backoff_seconds += seconds
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'retries_by_reason': dict(self.retries_by_reason),
+                'failures': self.failures,
+                'throttled_seconds': round(self.throttled_seconds, 2),
+                'backoff_seconds': round(self.backoff_seconds, 2),
+            }
+
+
+# 整個 process 共用的統計
+retry_stats = RetryStats()
@@ -4,13 +4,30 @@ Collection ID: 449326186730
 自動排除成人相關商品（含 adult 或 18+ 標籤）
 """
 
+import os
 import random
+import threading
+import time
+
+from catalog_store import catalog_scope
+from post_history import get_post_history
+from product_query import ProductQuery
+from tag_index import product_tags
 
 # 固定只發這個系列
 TARGET_COLLECTION_ID = 449326186730
 
 # 成人商品標籤（有這些 tag 的商品不會被發到社群）
-ADULT_TAGS = {'adult', '18+', '成人'}
+ADULT_TAGS = frozenset({'adult', '18+', '成人'})
+
+# 可以發文的商品：已上架、已發布到線上商店、不是成人商品
+# （條件交給 Shopify 篩選，不符合的商品不會被下載）
+POSTABLE_QUERY = ProductQuery(exclude_tags=ADULT_TAGS, status='active', published=True)
+
+# 候選池：最新的幾個可發文商品，以及多久後在背景更新
+# （更新期間仍用舊的候選池，選品不必等 Shopify）
+CANDIDATE_POOL_SIZE = 20
+CANDIDATE_POOL_TTL = 60
 
 
 def is_adult_product(product):
@@ -23,24 +40,186 @@ def is_adult_product(product):
     Returns:
         True = 成人商品（應排除），False = 一般商品
     """
-    tags = product.get('tags', '')
-    if isinstance(tags, str):
-        tag_list = [t.strip().lower() for t in tags.split(',') if t.strip()]
-    elif isinstance(tags, list):
-        tag_list = [t.strip().lower() for t in tags if t.strip()]
-    else:
-        tag_list = []
+    return not ADULT_TAGS.isdisjoint(product_tags(product))
+
+
+class CandidatePool:
+    """最新可發文商品的快取（thread-safe，同一個 process 內共用）"""
+
+    def __init__(self, loader, size=CANDIDATE_POOL_SIZE, ttl=CANDIDATE_POOL_TTL):
+        """
+        Args:
+            loader: loader(n) 回傳最新的 n 個可發文商品（新的優先）
+            size: 候選池大小
+            ttl: 過期秒數
+        """
+        self._loader = loader
+        self.size = size
+        self.ttl = ttl
+        self._products = []
+        self._loaded_at = None
+        self._refresh_seconds = None
+        self._refresh_count = 0
+        self._last_error = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def set_loader(self, loader):
+        """換成較新的 client 來載入"""
+        self._loader = loader
+
+    def refresh(self):
+        """同步重新載入（失敗時丟出例外，保留原本的候選池）"""
+        with self._load_lock:
+            started = time.monotonic()
+            try:
+                products = list(self._loader(self.size))
+            except Exception as e:
+                with self._lock:
+                    self._last_error = str(e)
+                raise
+
+            with self._lock:
+                self._products = products
+                self._loaded_at = time.time()
+                self._refresh_seconds = time.monotonic() - started
+                self._refresh_count += 1
+                self._last_error = None
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[CandidatePool] 背景更新失敗，繼續使用舊的候選池: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+    def products(self):
+        """
+        取得目前的候選商品（新的優先）
+        第一次使用時同步載入；過期時先回傳舊資料，同時在背景更新
+        """
+        with self._lock:
+            loaded_at = self._loaded_at
+
+        if loaded_at is None:
+            self.refresh()
+        elif time.time() - loaded_at > self.ttl:
+            self._refresh_in_background()
+
+        with self._lock:
+            return list(self._products)
+
+    def discard(self, product_id):
+        """移除某個商品（被刪除或修改時），並標記為過期"""
+        with self._lock:
+            self._products = [p for p in self._products if p.get('id') != product_id]
+            if self._loaded_at is not None:
+                self._loaded_at = 0
+
+    def invalidate(self):
+        """標記為過期，下次使用時在背景更新"""
+        with self._lock:
+            if self._loaded_at is not None:
+                self._loaded_at = 0
+
+    def status(self):
+        """候選池的新鮮度與更新耗時"""
+        with self._lock:
+            age = time.time() - self._loaded_at if self._loaded_at else None
+            return {
+                'size': len(self._products),
+                'age_seconds': round(age, 1) if age is not None else None,
+                'ttl_seconds': self.ttl,
+                'stale': age is None or age > self.ttl,
+                'refreshing': self._refreshing,
+                'last_refresh_seconds': round(self._refresh_seconds, 3) if self._refresh_seconds is not None else None,
+                'refresh_count': self._refresh_count,
+                'last_error': self._last_error,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_candidate_pool(store_url, fields, loader):
+    """
+    取得共用的候選池（同一個商店、同一組欄位只有一個）
+
+    Args:
+        store_url: 商店網址
+        fields: 商品欄位組合
+        loader: loader(n) 回傳最新的 n 個可發文商品
+    """
+    key = (store_url.rstrip('/').lower(), fields)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = CandidatePool(loader)
+        else:
+            pool.set_loader(loader)
+        return pool
 
-    return bool(ADULT_TAGS & set(tag_list))
+
+def invalidate_candidate_pools(product_id=None):
+    """
+    讓所有候選池在背景更新（Webhook 收到商品變動時呼叫）
+
+    Args:
+        product_id: 同時立刻把這個商品移出候選池（選填）
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        if product_id is not None:
+            pool.discard(int(product_id))
+        else:
+            pool.invalidate()
 
 
 class SmartSelector:
     """從指定系列中選擇最新商品"""
 
-    def __init__(self, shopify_client, config):
+    def __init__(self, shopify_client, config, fields='selector', history=None):
+        """
+        Args:
+            shopify_client: ShopifyClient
+            config: Config
+            fields: 商品欄位組合（要用 body_html 產生貼文時傳 'render'）
+            history: PostHistoryStore 發文記錄（預設用 config.POST_HISTORY_DB_PATH）
+        """
         self.shopify = shopify_client
         self.config = config
+        self.fields = fields
         self.last_category = None
+        if history is None:
+            db_path = getattr(config, 'POST_HISTORY_DB_PATH', None) or os.path.join('.', 'post_history.db')
+            history = get_post_history(db_path)
+        self.history = history
+
+    def _load_candidates(self, n):
+        """最新的 n 個可發文商品（本機快照或 GraphQL 搜尋，不抓整個系列）"""
+        max_age = getattr(self.config, 'CATALOG_MAX_AGE', 300)
+        return self.shopify.get_newest_products(
+            TARGET_COLLECTION_ID, n=n, fields=self.fields, max_age=max_age, query=POSTABLE_QUERY
+        )
+
+    @property
+    def candidate_pool(self):
+        """這個商店共用的候選池"""
+        return get_candidate_pool(self.shopify.store_url, self.fields, self._load_candidates)
 
     def get_next_product(self, category=None):
         """
@@ -50,22 +229,35 @@ class SmartSelector:
         Returns:
             (product, category) 或 (None, None)
         """
-        print(f"   📦 從系列 ID {TARGET_COLLECTION_ID}（一條連結，送到你家的服務）抓取商品...")
+        picks = self.get_next_products(1, category)
+        return picks[0] if picks else (None, None)
 
-        # 用 collection_id 直接抓商品（Admin API）
-        products = self.shopify.get_products_by_collection_id(TARGET_COLLECTION_ID, limit=250)
+    def get_next_products(self, n, category=None):
+        """
+        一次選出 n 個不重複的商品（同一份候選池、不放回抽樣）
+        自動排除成人相關商品；本輪已發過的商品排在最後，只有不夠時才會再選
 
-        if not products:
-            print(f"   ⚠️  沒有找到任何商品")
-            return None, None
+        Args:
+            n: 商品數量
+            category: 類別（目前固定為 fashion）
+
+        Returns:
+            [(product, category), ...]，候選商品不足 n 個時全部回傳（n <= 0 時為空）
+        """
+        n = max(int(n), 0)
+        if n == 0:
+            return []
+
+        print(f"   📦 從系列 ID {TARGET_COLLECTION_ID}（一條連結，送到你家的服務）抓取商品...")
 
-        # 按上架時間排序（新的優先）
-        products.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # 從共用的候選池取最新的可發文商品（過期時在背景更新，不必等 Shopify）
+        latest_products = self.candidate_pool.products()
 
-        # 只取最新的前 20 個
-        latest_products = products[:20]
+        if not latest_products:
+            print(f"   ⚠️  沒有找到任何商品")
+            return []
 
-        # 過濾掉成人商品
+        # 搜尋索引更新有延遲，剛加上成人標籤的商品可能還在結果裡，再檢查一次
         safe_products = [p for p in latest_products if not is_adult_product(p)]
 
         filtered_count = len(latest_products) - len(safe_products)
@@ -74,44 +266,99 @@ class SmartSelector:
 
         if not safe_products:
             print(f"   ⚠️  過濾後沒有可發布的商品")
-            return None, None
+            return []
 
-        # 從安全商品中隨機選擇
-        product = random.choice(safe_products)
-        print(f"   ✅ 選擇商品: {product.get('title', 'Unknown')}（從 {len(safe_products)} 個安全商品中選出，系列共 {len(products)} 個）")
+        # 本輪已發過的商品（一次查詢，用索引）
+        posted = self.history.round_posts('fashion', [p['id'] for p in safe_products])
+        fresh_products = [p for p in safe_products if p['id'] not in posted]
+        if posted:
+            print(f"   ⏭️  本輪已發過 {len(safe_products) - len(fresh_products)} 個")
+
+        # 不放回抽樣，同一批不會選到同一個商品
+        products = random.sample(fresh_products, min(n, len(fresh_products)))
+        if len(products) < n:
+            # 本輪沒發過的不夠：從最久以前發過的開始補
+            reposts = sorted((p for p in safe_products if p['id'] in posted), key=lambda p: posted[p['id']])
+            products += reposts[:n - len(products)]
+
+        for product in products:
+            print(f"   ✅ 選擇商品: {product.get('title', 'Unknown')}（從最新 {len(latest_products)} 個中的 {len(fresh_products)} 個本輪未發商品選出）")
+        if len(products) < n:
+            print(f"   ⚠️  只有 {len(products)} 個可發布的商品（要求 {n} 個）")
 
         self.last_category = 'fashion'
-        return product, 'fashion'
+        return [(product, 'fashion') for product in products]
+
+    def mark_as_posted(self, product, category, results=None):
+        """
+        記錄已發文（寫入本機發文記錄，不修改 Shopify 商品）
+
+        Args:
+            product: 商品
+            category: 類別
+            results: post_to_platforms() 的結果（含各平台的貼文 ID）
+
+        Returns:
+            是否記錄成功
+        """
+        if results is None:
+            results = {'manual': {'success': True}}
+        try:
+            self.history.record_post(product['id'], category or 'fashion', results)
+        except Exception as e:
+            print(f"   ⚠️  發文記錄寫入失敗: {e}")
+            return False
+        return True
 
-    def mark_as_posted(self, product, category):
-        """標記為已發文（目前不需要追蹤）"""
-        pass
+    def reset_round(self, category):
+        """
+        開始新的一輪（只更新輪次編號，不需要改任何商品）
+
+        Returns:
+            是否成功
+        """
+        try:
+            new_round = self.history.reset_round(category)
+        except Exception as e:
+            print(f"   ⚠️  重置輪次失敗: {e}")
+            return False
+        print(f"   🔄 {category} 進入第 {new_round} 輪")
+        return True
 
     def get_stats(self):
-        """取得統計資訊"""
-        products = self.shopify.get_products_by_collection_id(TARGET_COLLECTION_ID, limit=250)
-        total = len(products) if products else 0
-
-        if products:
-            products.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            latest = products[:20]
-            safe_count = len([p for p in latest if not is_adult_product(p)])
+        """取得統計資訊（latest_10 / remaining 與選品用的是同一份候選池）"""
+        # 和 get_next_products() 一樣：已上架、已發布、非成人的最新商品
+        latest = self.candidate_pool.products()
+        safe_ids = [p['id'] for p in latest if not is_adult_product(p)]
+
+        catalog = self.shopify.catalog
+        if catalog:
+            # 快照有系列成員的索引，直接計數，不必讀整個系列
+            total = catalog.count(catalog_scope(TARGET_COLLECTION_ID))
         else:
-            safe_count = 0
+            max_age = getattr(self.config, 'CATALOG_MAX_AGE', 300)
+            total = sum(1 for _ in self.shopify.iter_catalog_products(
+                TARGET_COLLECTION_ID, max_age=max_age, fields=self.fields
+            ))
+
+        posted = self.history.round_posts('fashion', safe_ids)
+        souvenir_round = self.history.round_stats('souvenir')
+        fashion_round = self.history.round_stats('fashion')
 
         return {
             'souvenir': {
                 'total': 0,
                 'latest_10': 0,
-                'round': 0,
-                'posted_this_round': 0,
+                'round': souvenir_round['round'],
+                'posted_this_round': souvenir_round['posted_this_round'],
                 'remaining': 0
             },
             'fashion': {
                 'total': total,
-                'latest_10': safe_count,
-                'round': 1,
-                'posted_this_round': 0,
-                'remaining': safe_count
-            }
+                'latest_10': len(safe_ids),
+                'round': fashion_round['round'],
+                'posted_this_round': fashion_round['posted_this_round'],
+                'remaining': len(safe_ids) - len(posted)
+            },
+            'candidate_pool': self.candidate_pool.status()
         }
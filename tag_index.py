@@ -0,0 +1,77 @@
+"""
+商品標籤與關鍵字索引
+同一串標籤字串（或同一組 handle / 類型 / 標籤）只正規化一次，
+結果是共用的 frozenset（字串經過 intern），成人過濾、系列篩選、
+類型 Hashtag（hashtag_registry）都只做 set 運算，不必每次重新切字串、轉小寫
+"""
+
+import re
+import sys
+from functools import lru_cache
+
+# 快取多少組不同的標籤字串（商品數量級；超過時丟掉最久沒用的）
+TAG_CACHE_SIZE = 8192
+
+# 英數關鍵字的切割方式（handle 的 -、標籤的逗號、空白都當分隔）
+_TOKEN_SPLIT = re.compile(r'[^0-9a-z+]+')
+
+
+def _tags_key(tags):
+    """tags 欄位 → 可 hash 的快取鍵（逗號字串原樣、list 轉 tuple）"""
+    if isinstance(tags, str):
+        return tags
+    if isinstance(tags, (list, tuple)):
+        return tuple(t for t in tags if isinstance(t, str))
+    return ''
+
+
+@lru_cache(maxsize=TAG_CACHE_SIZE)
+def _normalize_tags(key):
+    items = key.split(',') if isinstance(key, str) else key
+    return frozenset(sys.intern(t.strip().lower()) for t in items if t and t.strip())
+
+
+def product_tags(product):
+    """
+    取出商品的標籤（小寫、去空白）
+
+    Args:
+        product: Shopify 商品資料（tags 可以是逗號分隔字串或 list）
+
+    Returns:
+        標籤 frozenset（同樣的標籤字串共用同一個物件，不要修改）
+    """
+    return _normalize_tags(_tags_key(product.get('tags', '')))
+
+
+@lru_cache(maxsize=TAG_CACHE_SIZE)
+def _keyword_tokens(handle, product_type, tags_key):
+    tokens = set(_TOKEN_SPLIT.split(f"{handle} {product_type}".lower()))
+    for tag in _normalize_tags(tags_key):
+        tokens.update(_TOKEN_SPLIT.split(tag))
+    tokens.discard('')
+    return frozenset(sys.intern(t) for t in tokens)
+
+
+def product_keywords(product):
+    """
+    商品 handle、類型、標籤切出來的英數關鍵字（小寫）
+
+    Returns:
+        關鍵字 frozenset，例如 bape-mens-tee → {'bape', 'mens', 'tee'}
+    """
+    return _keyword_tokens(
+        product.get('handle') or '',
+        product.get('product_type') or '',
+        _tags_key(product.get('tags', '')),
+    )
+
+
+def cache_info():
+    """標籤快取的命中統計"""
+    tags = _normalize_tags.cache_info()
+    keywords = _keyword_tokens.cache_info()
+    return {
+        'tags': {'hits': tags.hits, 'misses': tags.misses, 'size': tags.currsize},
+        'keywords': {'hits': keywords.hits, 'misses': keywords.misses, 'size': keywords.currsize},
+    }
@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shopify_graphql as gql
+from shopify_client import ShopifyClient
+
+# 系列匯出的結果：第一行是系列本身，商品的 __parentId 指向系列，
+# 圖片與規格的 __parentId 指向商品
+BULK_LINES = [
+    {'id': 'gid://shopify/Collection/42'},
+    {'id': 'gid://shopify/Product/1', 'title': 'BAPE Tee', 'handle': 'bape-tee',
+     'descriptionHtml': '<p>tee</p>', 'createdAt': '2024-05-01T00:00:00Z',
+     'updatedAt': '2024-05-02T00:00:00Z', 'publishedAt': '2024-05-01T00:00:00Z',
+     'tags': ['bape', 'mens'], 'productType': 'T-Shirt', 'vendor': 'BAPE', 'status': 'ACTIVE',
+     '__parentId': 'gid://shopify/Collection/42'},
+    {'id': 'gid://shopify/ProductImage/11', 'url': 'https://cdn.example/1.jpg', 'altText': None,
+     'width': 800, 'height': 600, '__parentId': 'gid://shopify/Product/1'},
+    {'id': 'gid://shopify/ProductVariant/101', 'title': 'M', 'price': '5800.00', 'sku': 'B-M',
+     'position': 1, '__parentId': 'gid://shopify/Product/1'},
+    {'id': 'gid://shopify/ProductVariant/102', 'title': 'L', 'price': '5800.00', 'sku': 'B-L',
+     'position': 2, '__parentId': 'gid://shopify/Product/1'},
+    {'id': 'gid://shopify/Product/2', 'title': '小倉山莊 禮盒', 'handle': 'ogura-box',
+     'descriptionHtml': None, 'createdAt': '2024-04-01T00:00:00Z',
+     'updatedAt': '2024-04-01T00:00:00Z', 'publishedAt': None,
+     'tags': [], 'productType': '', 'vendor': '小倉山莊', 'status': 'DRAFT',
+     '__parentId': 'gid://shopify/Collection/42'},
+    {'id': 'gid://shopify/ProductVariant/201', 'title': 'Default Title', 'price': '1200.00',
+     'sku': None, 'position': 1, '__parentId': 'gid://shopify/Product/2'},
+]
+
+BULK_JSONL = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in BULK_LINES).encode('utf-8')
+
+
+class FakeShopify(BaseHTTPRequestHandler):
+    """GraphQL 端點（啟動 bulk operation、查詢進度）與 JSONL 下載"""
+
+    queries = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, content_type='application/json'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/bulk.jsonl':
+            self.send_error(404)
+            return
+        self._reply(BULK_JSONL, 'application/jsonl')
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if 'bulkOperationRunQuery' in payload['query']:
+            FakeShopify.queries.append(payload['variables']['query'])
+            data = {'bulkOperationRunQuery': {
+                'bulkOperation': {'id': 'gid://shopify/BulkOperation/7', 'status': 'CREATED'},
+                'userErrors': [],
+            }}
+        else:
+            host, port = self.server.server_address
+            data = {'node': {
+                'id': payload['variables']['id'], 'status': 'COMPLETED', 'errorCode': None,
+                'objectCount': str(len(BULK_LINES)), 'url': f'http://{host}:{port}/bulk.jsonl',
+                'partialDataUrl': None,
+            }}
+        self._reply(json.dumps({'data': data}).encode('utf-8'))
+
+
+class BulkProductsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeShopify)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        host, port = cls.server.server_address
+        cls.store_url = f'http://{host}:{port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeShopify.queries.clear()
+        self.client = ShopifyClient(self.store_url, access_token='test-token', http_cache=None)
+
+    def assert_rest_products(self, products):
+        self.assertEqual([p['id'] for p in products], [1, 2])
+        tee, box = products
+
+        self.assertEqual(tee['title'], 'BAPE Tee')
+        self.assertEqual(tee['handle'], 'bape-tee')
+        self.assertEqual(tee['body_html'], '<p>tee</p>')
+        self.assertEqual(tee['created_at'], '2024-05-01T00:00:00Z')
+        self.assertEqual(tee['tags'], 'bape, mens')
+        self.assertEqual(tee['product_type'], 'T-Shirt')
+        self.assertEqual(tee['status'], 'active')
+        self.assertEqual(tee['images'], [{
+            'id': 11, 'src': 'https://cdn.example/1.jpg', 'alt': None,
+            'width': 800, 'height': 600, 'position': 1,
+        }])
+        self.assertEqual([(v['id'], v['title'], v['price'], v['position']) for v in tee['variants']],
+                         [(101, 'M', '5800.00', 1), (102, 'L', '5800.00', 2)])
+
+        # 沒有圖片的商品：images 是空 list，不會拿到上一個商品的圖片
+        self.assertEqual(box['images'], [])
+        self.assertEqual(box['tags'], '')
+        self.assertEqual(box['status'], 'draft')
+        self.assertIsNone(box['published_at'])
+        self.assertEqual([v['id'] for v in box['variants']], [201])
+
+    def test_parse_bulk_products(self):
+        self.assert_rest_products(list(gql.parse_bulk_products(BULK_JSONL.splitlines())))
+
+    def test_iter_bulk_products_streams_jsonl(self):
+        products = list(self.client.iter_bulk_products(f'{self.store_url}/bulk.jsonl'))
+        self.assert_rest_products(products)
+
+    def test_iter_bulk_products_without_url(self):
+        self.assertEqual(list(self.client.iter_bulk_products('')), [])
+
+    def test_get_all_products_bulk_for_collection(self):
+        products = self.client.get_all_products_bulk(collection_id=42, poll_interval=0, timeout=10)
+        self.assert_rest_products(products)
+        self.assertEqual(len(FakeShopify.queries), 1)
+        self.assertIn('collection(id: "gid://shopify/Collection/42")', FakeShopify.queries[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
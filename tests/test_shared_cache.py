@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_cache import SharedCache
+
+
+class SharedCacheInvalidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'stats.json')
+        self.loads = 0
+        # 背景更新要等測試確認過「先回傳舊值」才放行
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def loader(self):
+        if self.loads >= 1:
+            self.release.wait(5)
+        self.loads += 1
+        return {'n': self.loads}
+
+    def wait_for_refresh(self, cache):
+        self.release.set()
+        for _ in range(100):
+            if not cache.status()['refreshing'] and self.loads >= 2:
+                return
+            time.sleep(0.02)
+        self.fail('背景更新沒有完成')
+
+    def test_invalidate_then_get_serves_stale_and_refreshes(self):
+        cache = SharedCache(self.path, self.loader, ttl=60)
+        self.assertEqual(cache.get(), {'n': 1})
+
+        cache.invalidate()
+        self.assertTrue(cache.status()['stale'])
+        self.assertEqual(cache.get(), {'n': 1})
+
+        self.wait_for_refresh(cache)
+        self.assertEqual(cache.get(), {'n': 2})
+        self.assertFalse(cache.status()['stale'])
+
+    def test_invalidate_then_peek_serves_stale_and_refreshes(self):
+        cache = SharedCache(self.path, self.loader, ttl=60)
+        # 沒有資料時不等待（背景載入可能已經完成）
+        self.assertIn(cache.peek(), (None, {'n': 1}))
+        for _ in range(100):
+            if cache.peek() is not None:
+                break
+            time.sleep(0.02)
+        self.assertEqual(cache.peek(), {'n': 1})
+
+        cache.invalidate()
+        self.assertEqual(cache.peek(), {'n': 1})
+
+        self.wait_for_refresh(cache)
+        self.assertEqual(cache.peek(), {'n': 2})
+
+    def test_invalidate_seen_by_other_instance(self):
+        writer = SharedCache(self.path, self.loader, ttl=60)
+        writer.get()
+        reader = SharedCache(self.path, self.loader, ttl=60)
+        writer.invalidate()
+        self.assertEqual(reader.get(), {'n': 1})
+        self.wait_for_refresh(reader)
+
+
+if __name__ == '__main__':
+    unittest.main()